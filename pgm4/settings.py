@@ -64,28 +64,41 @@ INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.admindocs',
 
-    'pgm4app',
+    'pgm4app.apps.Pgm4AppConfig',
 ]
 
 MIDDLEWARE_CLASSES = [
+    'pgm4app.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'pgm4app.middleware.CachedAuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'pgm4app.middleware.ProfilerMiddleware',  # must be last
 ]
 
 ROOT_URLCONF = 'pgm4.urls'
 
+APP_TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Outside DEBUG, compiled templates are kept in memory by the
+            # cached loader, so includes and inclusion tags inside loops are
+            # loaded and parsed only once per process.
+            'loaders': APP_TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader',
+                 APP_TEMPLATE_LOADERS),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.contrib.auth.context_processors.auth',
@@ -102,12 +115,114 @@ WSGI_APPLICATION = 'pgm4.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
-DATABASES = {
+#
+# The database profile is picked with the PGM4_DB environment variable, either
+# "sqlite" (default) or "postgresql". Both keep connections open between
+# requests (CONN_MAX_AGE), so per-connection setup only runs once per worker.
+
+DB_PROFILE = os.environ.get('PGM4_DB', 'sqlite')
+
+# Seconds a database connection is kept open for reuse by later requests.
+DB_CONN_MAX_AGE = int(os.environ.get('PGM4_DB_CONN_MAX_AGE', 600))
+
+# Milliseconds a single statement may run (PostgreSQL) or a writer may wait
+# for a lock (SQLite busy timeout) before giving up. The statement timeout is
+# only meant for web requests: pgm4/wsgi.py defaults it to 5000, management
+# commands (migrate, run_jobs, rerender_content, ...) run without one unless
+# PGM4_DB_STATEMENT_TIMEOUT is set. 0 disables it.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('PGM4_DB_STATEMENT_TIMEOUT', 0))
+DB_BUSY_TIMEOUT = int(os.environ.get('PGM4_DB_BUSY_TIMEOUT', 20000))
+
+# Number of rows fetched per query by pgm4app.utils.iterate_in_chunks() when
+# walking over large tables.
+DB_ITERATOR_CHUNK_SIZE = 2000
+
+if DB_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PGM4_DB_NAME', 'pgm4'),
+            'USER': os.environ.get('PGM4_DB_USER', 'pgm4'),
+            'PASSWORD': os.environ.get('PGM4_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PGM4_DB_HOST', ''),
+            'PORT': os.environ.get('PGM4_DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {},
+        }
+    }
+    if DB_STATEMENT_TIMEOUT:
+        DATABASES['default']['OPTIONS']['options'] = \
+            '-c statement_timeout={}'.format(DB_STATEMENT_TIMEOUT)
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get(
+                'PGM4_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds, used by the sqlite3 module while opening.
+                'timeout': DB_BUSY_TIMEOUT / 1000,
+            },
+        }
+    }
+
+# Applied to every new SQLite connection by pgm4app.signals. WAL lets readers
+# continue while a vote or answer is written, and "synchronous = NORMAL" is
+# safe in WAL mode while avoiding an fsync on every commit.
+SQLITE_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', DB_BUSY_TIMEOUT),
+    ('cache_size', -32000),  # negative means KiB, so 32 MB page cache
+    ('mmap_size', 268435456),  # 256 MB
+    ('temp_store', 'MEMORY'),
+]
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+#
+# Several parts of the app invalidate state through the cache and expect all
+# processes to see that: cached sessions and users, the tag autocomplete
+# index, the feed versions, the tag posting lists and the dashboard refresh
+# lock. The default local memory cache is private to each process, so with
+# more than one worker process set PGM4_CACHE_BACKEND to a shared backend,
+# e.g. "django.core.cache.backends.memcached.PyLibMCCache" with
+# PGM4_CACHE_LOCATION="127.0.0.1:11211". "manage.py check --deploy" warns
+# about a process local cache.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.environ.get(
+            'PGM4_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PGM4_CACHE_LOCATION', 'pgm4'),
+        'TIMEOUT': 300,
     }
 }
+CACHE_IS_SHARED = not CACHES['default']['BACKEND'].endswith('LocMemCache')
+
+
+# With a shared cache, sessions are read from the cache and only written (to
+# cache and database) when they change. A process local cache would keep
+# serving a session that another process ended, so without one they are
+# read from the database. Set PGM4_SESSION_ENGINE to
+# "django.contrib.sessions.backends.signed_cookies" to keep no server side
+# session state at all.
+SESSION_ENGINE = os.environ.get(
+    'PGM4_SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if CACHE_IS_SHARED
+    else 'django.contrib.sessions.backends.db')
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Flash messages travel in a cookie, so they never cause a session write.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Seconds a resolved user object is cached by CachedAuthenticationMiddleware.
+# 0 (the default without a shared cache) loads the user from the database
+# on every request, as AuthenticationMiddleware does.
+AUTH_USER_CACHE_TIMEOUT = 600 if CACHE_IS_SHARED else 0
 
 
 # Password validation
@@ -141,6 +256,17 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# collectstatic writes content hashed file names plus precompressed .gz (and
+# .br, if brotli is installed) copies into STATIC_ROOT.
+STATICFILES_STORAGE = 'pgm4app.storage.CompressedManifestStaticFilesStorage'
+
+# Serve STATIC_ROOT from the app itself, for deployments without a separate
+# web server in front. Hashed files are sent with a one year immutable
+# Cache-Control header.
+SERVE_STATIC = os.environ.get('PGM4_SERVE_STATIC', '') == '1'
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_UNHASHED_MAX_AGE = 5 * 60
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'uploaded_files')
 
@@ -149,6 +275,170 @@ AUTHENTICATION_BACKENDS = (
     'allauth.account.auth_backends.AuthenticationBackend',
 )
 
+# --- Response compression -----------------------------------------------------
+
+# Responses shorter than this many bytes are sent uncompressed, and so are
+# responses that contain the CSRF token (BREACH), e.g. the vote forms that
+# logged in users see. Anonymous users get login links instead.
+COMPRESS_MIN_SIZE = 512
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+
+# Seconds a compressed body is cached under the hash of its uncompressed
+# content. Set to 0 to compress every response again.
+COMPRESS_CACHE_TIMEOUT = 300
+
+# --- Trending -----------------------------------------------------------------
+
+# Rings of rolling counters kept per question and per tag, as
+# {name: (seconds per bucket, number of buckets)}. "m" counts the last hour
+# by minute, "h" the last day by hour.
+TRENDING_RINGS = {
+    'm': (60, 60),
+    'h': (60 * 60, 24),
+}
+TRENDING_DEFAULT_RING = 'h'
+TRENDING_VOTE_WEIGHT = 1
+TRENDING_ANSWER_WEIGHT = 3
+TRENDING_QUESTIONS_LIMIT = 200
+TRENDING_CACHE_TIMEOUT = 60
+
+# --- Tag autocomplete ---------------------------------------------------------
+
+# Seconds before the in-process tag index is rebuilt to refresh popularity
+# counts. Tag changes always rebuild it right away.
+TAG_INDEX_MAX_AGE = 300
+TAG_AUTOCOMPLETE_LIMIT = 10
+
+# --- Revisions ----------------------------------------------------------------
+
+# Every REVISIONS_FULL_EVERY-th former text of a post is stored in full
+# instead of as a diff, which bounds the work to rebuild any revision.
+REVISIONS_FULL_EVERY = 20
+
+# --- Tag queries --------------------------------------------------------------
+
+# Seconds between reads of new tag assignments into the in-process posting
+# lists, and before the lists are rebuilt from scratch. Hiding or untagging
+# a question only reaches other processes through a shared cache, without
+# one they rebuild every minute.
+POSTINGS_REFRESH_INTERVAL = 5
+POSTINGS_MAX_AGE = 3600 if CACHE_IS_SHARED else 60
+
+# Rows of the tags table before the highest one seen that are read again on
+# every refresh, to catch up on rows with lower ids that committed later.
+POSTINGS_REFRESH_OVERLAP = 1000
+
+# --- Similar questions --------------------------------------------------------
+
+# Changing the signature size or band rows requires running the
+# build_similarity_index command. Titles are short, so bands are narrow: with
+# 32 bands of 2 rows, two questions sharing 40% of their words land in a
+# common bucket with more than 99% probability.
+SIMILARITY_NUM_PERM = 64
+SIMILARITY_BAND_ROWS = 2
+SIMILARITY_MIN_SCORE = 0.15
+SIMILARITY_MAX_CANDIDATES = 200
+SIMILAR_QUESTIONS_LIMIT = 5
+
+# Seconds the related questions of a question page are cached. Editing the
+# question clears them, new similar questions show up after this long.
+SIMILAR_QUESTIONS_CACHE_TIMEOUT = 3600
+
+# --- Home page dashboard ------------------------------------------------------
+
+# The home page sections are rebuilt when they are older than
+# DASHBOARD_MAX_AGE seconds, by the first request that sees them (through the
+# job queue) or by running the refresh_dashboard command more often than that.
+DASHBOARD_SECTION_SIZE = 10
+DASHBOARD_MAX_AGE = 60
+DASHBOARD_LOCK_TIMEOUT = 30
+
+# --- Question threads ---------------------------------------------------------
+
+# A question page shows the first THREAD_ANSWERS_PAGE_SIZE answers and the
+# first THREAD_COMMENTS_PAGE_SIZE comments of every post, the rest is loaded
+# on request in pages of the same size.
+THREAD_ANSWERS_PAGE_SIZE = 20
+THREAD_COMMENTS_PAGE_SIZE = 5
+
+# --- Followed tags feed -------------------------------------------------------
+
+# New questions are pushed into the timelines of the followers of a tag with
+# at most FEED_FANOUT_MAX_FOLLOWERS followers. Questions in more popular tags
+# are merged in when the feed is read, from lists of their recent question
+# ids cached for at most FEED_TAG_IDS_MAX_AGE seconds. Timelines keep
+# FEED_TIMELINE_LENGTH entries per user.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_TIMELINE_LENGTH = 500
+FEED_TAG_IDS_MAX_AGE = 600
+FEED_PAGE_SIZE = 20
+
+# --- Sitemaps -----------------------------------------------------------------
+
+# The build_sitemaps command writes the sitemap index and its chunk files to
+# SITEMAP_ROOT, to be served by the web server or the sitemap views. The
+# sitemap protocol allows at most 50000 URLs per file.
+SITEMAP_ROOT = os.path.join(BASE_DIR, 'sitemaps')
+SITEMAP_CHUNK_SIZE = 50000
+
+# --- Atom feeds ---------------------------------------------------------------
+
+# Changed questions expire the cached feeds right away. The timeout only
+# bounds how long the hot feed keeps an order that votes have changed since.
+ATOM_FEED_ITEMS = 30
+ATOM_FEED_CACHE_TIMEOUT = 10 * 60
+
+# --- Admin --------------------------------------------------------------------
+
+# Admin lists count at most this many rows of a filtered selection, and use
+# the PostgreSQL row estimate for unfiltered tables larger than this.
+ADMIN_COUNT_LIMIT = 10000
+
+# --- Background jobs ----------------------------------------------------------
+
+# Side effects of writes (trending counters, similar questions index, feeds,
+# rendering) are pgm4app.jobs jobs. They run inline in the request unless
+# PGM4_JOBS_INLINE=0, which queues them for the run_jobs worker command.
+# View count merges and revisions are always queued, so run_jobs (or
+# "run_jobs --once" from cron) is required either way.
+JOBS_RUN_INLINE = os.environ.get('PGM4_JOBS_INLINE', '1') == '1'
+JOBS_MAX_ATTEMPTS = 5
+# Seconds before the first retry of a failed job, doubled for every retry.
+JOBS_RETRY_DELAY = 10
+# Seconds after which a job claimed by a worker that died is run again.
+JOBS_TIMEOUT = 5 * 60
+
+# --- View counts --------------------------------------------------------------
+
+# Unique viewers are counted in HyperLogLog sketches of 2 ** precision bytes
+# per question, with a standard error of 1.04 / sqrt(2 ** precision). Every
+# process hands its sketches to the job queue every VIEW_FLUSH_INTERVAL
+# seconds, or when it holds sketches of VIEW_MAX_PENDING questions.
+VIEW_SKETCH_PRECISION = 12
+VIEW_FLUSH_INTERVAL = 60
+VIEW_MAX_PENDING = 1000
+VIEW_COUNT_BOT_PATTERN = r'bot|crawl|spider|slurp|facebookexternalhit'
+
+# --- Worker warm up -----------------------------------------------------------
+
+# Warm up URLs, templates and the Markdown pipeline when pgm4/wsgi.py is
+# loaded. Set PGM4_WARMUP=0 to skip it, e.g. for the development server.
+WARMUP_ON_LOAD = os.environ.get('PGM4_WARMUP', '1') == '1'
+
+# --- Profiling ----------------------------------------------------------------
+
+# With PGM4_PROFILER=1, staff requests sent with an "X-Profile: 1" header and
+# a random PROFILER_SAMPLE_RATE share of all requests are profiled, and the
+# dumps are written to PROFILER_DIR. Summarize them with profile_report.
+# PROFILER_MODE is "cprofile" (exact, slow) or "sample" (stack sampling every
+# PROFILER_SAMPLE_INTERVAL seconds, cheap, for flame graphs).
+PROFILER_ENABLED = os.environ.get('PGM4_PROFILER', '') == '1'
+PROFILER_SAMPLE_RATE = float(os.environ.get('PGM4_PROFILER_SAMPLE_RATE', 0))
+PROFILER_MODE = os.environ.get('PGM4_PROFILER_MODE', 'cprofile')
+PROFILER_SAMPLE_INTERVAL = 0.005
+PROFILER_DIR = os.path.join(BASE_DIR, 'profiles')
+
 # --- django-allauth settings --------------------------------------------------
 # http://django-allauth.readthedocs.org/en/latest/configuration.html
 
@@ -17,6 +17,7 @@ from django.conf import settings
 from django.conf.urls import url, include
 from django.contrib import admin
 
+import pgm4app.feeds
 import pgm4app.views
 
 urlpatterns = [
@@ -25,13 +26,24 @@ urlpatterns = [
 
     url(r'^$',
         pgm4app.views.HomeView.as_view(), name='home'),
+    url(r'^(?P<name>sitemap\.xml)$',
+        pgm4app.views.SitemapView.as_view(), name='sitemap-index'),
+    url(r'^sitemaps/(?P<name>[a-z]+-\d+\.xml)$',
+        pgm4app.views.SitemapView.as_view(), name='sitemap'),
     url(r'^users/$',
         pgm4app.views.UserListView.as_view(), name='user-list'),
     url(r'^users/(?P<username>\w+)/$',
         pgm4app.views.UserDetailView.as_view(), name='user-detail'),
 
+    url(r'^inbox/$',
+        pgm4app.views.InboxView.as_view(), name='inbox'),
+    url(r'^feed/$',
+        pgm4app.views.FeedView.as_view(), name='feed'),
+
     url(r'^ask/$',
         pgm4app.views.QuestionCreateView.as_view(), name='question-create'),
+    url(r'^ask/similar/$',
+        pgm4app.views.SimilarQuestionsView.as_view(), name='question-similar'),
     url(r'^ask/(?P<pk>\d+)/$',
         pgm4app.views.QuestionUpdateView.as_view(), name='question-update'),
 
@@ -47,20 +59,49 @@ urlpatterns = [
 
     url(r'^questions/$',
         pgm4app.views.QuestionListView.as_view(), name='question-list'),
+    url(r'^questions/feed/(?P<order>new|hot)/$',
+        pgm4app.feeds.QuestionsFeed(), name='question-feed'),
     url(r'^questions/(?P<pk>\d+)/(?P<slug>[a-z0-9_-]+)/$',
         pgm4app.views.QuestionDetailView.as_view(), name='question-detail'),
+    url(r'^thread/(?P<pk>\d+)/answers/$',
+        pgm4app.views.AnswerPageView.as_view(), name='answer-page'),
+    url(r'^thread/(?P<pk>\d+)/comments/$',
+        pgm4app.views.CommentPageView.as_view(), name='comment-page'),
+    url(r'^revisions/(?P<pk>\d+)/$',
+        pgm4app.views.RevisionsView.as_view(), name='content-revisions'),
 
     url(r'^tags/$',
         pgm4app.views.TagListView.as_view(), name='tag-list'),
+    url(r'^tags/autocomplete/$',
+        pgm4app.views.TagAutocompleteView.as_view(), name='tag-autocomplete'),
     url(r'^tags/(?P<slug>[a-z0-9_-]+)/$',
         pgm4app.views.TagDetailView.as_view(), name='tag-detail'),
+    url(r'^tags/(?P<slug>[a-z0-9_-]+)/follow/$',
+        pgm4app.views.TagFollowView.as_view(), {'follow': True},
+        name='tag-follow'),
+    url(r'^tags/(?P<slug>[a-z0-9_-]+)/unfollow/$',
+        pgm4app.views.TagFollowView.as_view(), {'follow': False},
+        name='tag-unfollow'),
+    url(r'^tags/(?P<slug>[a-z0-9_-]+)/feed/$',
+        pgm4app.feeds.TagQuestionsFeed(), name='tag-feed'),
 
+    url(r'^accept/(?P<pk>\d+)/$',
+        pgm4app.views.AcceptView.as_view(), {'accept': True}, name='accept'),
+    url(r'^unaccept/(?P<pk>\d+)/$',
+        pgm4app.views.AcceptView.as_view(), {'accept': False},
+        name='unaccept'),
     url(r'^vote/(?P<pk>\d+)/up/$',
         pgm4app.views.VoteView.as_view(), {'vote': 1}, name='vote-up'),
     url(r'^vote/(?P<pk>\d+)/down/$',
         pgm4app.views.VoteView.as_view(), {'vote': -1}, name='vote-down'),
 ]
 
+if settings.SERVE_STATIC and not settings.DEBUG:
+    urlpatterns += [
+        url(r'^{}(?P<path>.+)$'.format(settings.STATIC_URL.lstrip('/')),
+            pgm4app.views.StaticFileView.as_view(), name='static-file'),
+    ]
+
 if settings.DEBUG:
     from django.contrib.staticfiles.urls import staticfiles_urlpatterns
     from django.conf.urls.static import static
@@ -13,4 +13,16 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pgm4.settings")
 
+# Only web requests get a statement timeout by default, see
+# DB_STATEMENT_TIMEOUT in pgm4/settings.py.
+os.environ.setdefault("PGM4_DB_STATEMENT_TIMEOUT", "5000")
+
 application = get_wsgi_application()
+
+# Import and compile what the first requests would, before the server forks
+# its workers (see pgm4app.warmup).
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_LOAD:
+    from pgm4app.warmup import warm_up
+    warm_up()
@@ -1,7 +1,154 @@
-from django.contrib import admin
+"""
+Admin for tables with millions of rows: list pages never count or sort a
+whole table, filters only use indexed columns, foreign keys are edited as
+raw ids, and bulk actions and exports walk the selection in primary key
+chunks.
+"""
+import csv
 
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext_lazy as _
+
+from pgm4app.feeds import invalidate_feeds
 from pgm4app.models import Content, Tag, Vote
+from pgm4app.postings import invalidate_postings
+from pgm4app.utils import iterate_in_chunks, update_in_chunks
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate for unfiltered lists on PostgreSQL, and
+    count at most settings.ADMIN_COUNT_LIMIT rows otherwise. An exact
+    COUNT(*) has to read the whole table or index.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class '
+                               'WHERE relname = %s',
+                               [query.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > settings.ADMIN_COUNT_LIMIT:
+                return int(row[0])
+
+        limit = settings.ADMIN_COUNT_LIMIT
+        return self.object_list.order_by().values('pk')[:limit].count()
+
+
+class Echo:
+    """A file-like object for csv.writer that returns what is written."""
+
+    def write(self, value):
+        return value
+
+
+def _prepend(first, lines):
+    yield first
+    yield from lines
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-pk', )
+
+
+class ContentAdmin(LargeTableAdmin):
+    list_display = ('pk', 'content_type', 'title', 'user', 'parent_id',
+                    'created', 'points', 'is_hidden', 'is_deleted')
+    list_filter = ('content_type', 'is_hidden', 'is_deleted')
+    list_select_related = ('user', )
+    search_fields = ('=user__username', )
+    raw_id_fields = ('tags', )
+    readonly_fields = ('content_type', 'user', 'parent_id', 'created',
+                       'edited', 'last_answered')
+    actions = ('mark_deleted', 'mark_not_deleted', 'mark_hidden',
+               'mark_not_hidden', 'export_csv')
+    csv_fields = ('id', 'content_type', 'title', 'user__username',
+                  'parent_id', 'created', 'edited', 'points', 'count_views',
+                  'count_answers', 'count_comments', 'is_hidden',
+                  'is_deleted')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('text')
+
+    def get_actions(self, request):
+        # The default delete action loads every selected object and its
+        # related objects for the confirmation page. Use mark_deleted.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def update_flags(self, queryset, **values):
+        """
+        Update the selection in chunks. QuerySet.update() sends no post_save
+        signals, so expire the feeds and posting lists here.
+        """
+        slugs = list(Tag.objects
+                     .filter(content__in=queryset.values('pk'),
+                             content__content_type='q')
+                     .values_list('slug', flat=True).distinct())
+        count = update_in_chunks(queryset, **values)
+        invalidate_feeds(slugs)
+        invalidate_postings()
+        return count
+
+    def mark_deleted(self, request, queryset):
+        count = self.update_flags(queryset, is_deleted=True)
+        messages.success(request, _('{} items deleted.').format(count))
+    mark_deleted.short_description = _('Delete selected items')
+
+    def mark_not_deleted(self, request, queryset):
+        count = self.update_flags(queryset, is_deleted=False)
+        messages.success(request, _('{} items restored.').format(count))
+    mark_not_deleted.short_description = _('Restore selected items')
+
+    def mark_hidden(self, request, queryset):
+        count = self.update_flags(queryset, is_hidden=True)
+        messages.success(request, _('{} items hidden.').format(count))
+    mark_hidden.short_description = _('Hide selected items')
+
+    def mark_not_hidden(self, request, queryset):
+        count = self.update_flags(queryset, is_hidden=False)
+        messages.success(request, _('{} items shown.').format(count))
+    mark_not_hidden.short_description = _('Show selected items')
+
+    def export_csv(self, request, queryset):
+        """Stream the selection as CSV, one chunk of rows in memory."""
+        rows = iterate_in_chunks(queryset.values_list(*self.csv_fields))
+        writer = csv.writer(Echo())
+        lines = (writer.writerow(row) for row in rows)
+        response = StreamingHttpResponse(
+            _prepend(writer.writerow(self.csv_fields), lines),
+            content_type='text/csv')
+        response['Content-Disposition'] = \
+            'attachment; filename="content.csv"'
+        return response
+    export_csv.short_description = _('Export selected items as CSV')
+
+
+class VoteAdmin(LargeTableAdmin):
+    list_display = ('pk', 'user', 'content_id', 'value', 'created')
+    list_select_related = ('user', )
+    search_fields = ('=user__username', )
+    readonly_fields = ('user', 'content_id', 'value', 'created')
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'count_followers')
+    search_fields = ('^slug', )
+    ordering = ('slug', )
+
 
-admin.site.register(Content)
-admin.site.register(Tag)
-admin.site.register(Vote)
+admin.site.register(Content, ContentAdmin)
+admin.site.register(Tag, TagAdmin)
+admin.site.register(Vote, VoteAdmin)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class Pgm4AppConfig(AppConfig):
     name = 'pgm4app'
+
+    def ready(self):
+        import pgm4app.checks  # noqa: register system checks
+        import pgm4app.signals  # noqa: connect signal receivers
+        import pgm4app.tasks  # noqa: register job handlers
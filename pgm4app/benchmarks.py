@@ -0,0 +1,64 @@
+"""
+Helpers shared by the bench_* management commands.
+"""
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile (0-100) of a list of numbers."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+class Timings:
+    """
+    Collect wall clock timings (in seconds) per operation name and print a
+    summary table with count, throughput and latency percentiles.
+    """
+
+    def __init__(self):
+        self.samples = OrderedDict()
+        self.errors = OrderedDict()
+
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        else:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def merge(self, other):
+        for name, values in other.samples.items():
+            self.samples.setdefault(name, []).extend(values)
+        for name, count in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + count
+
+    def report(self, write, elapsed=None):
+        """
+        Write one line per operation using the write callable.
+        :param elapsed: total wall time, used to print operations per second.
+        """
+        write('{:<24} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+            'operation', 'count', 'errors', 'ops/s', 'p50 ms', 'p95 ms',
+            'p99 ms'))
+        for name, values in self.samples.items():
+            rate = len(values) / elapsed if elapsed else 0.0
+            write('{:<24} {:>7} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}'
+                  .format(name, len(values), self.errors.get(name, 0), rate,
+                          percentile(values, 50) * 1000,
+                          percentile(values, 95) * 1000,
+                          percentile(values, 99) * 1000))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cache versions and locks that invalidate per-process state (tag index,
+    feeds, posting lists, dashboard lock, cached sessions and users) only
+    reach the other worker processes through a shared cache.
+    """
+    if settings.CACHE_IS_SHARED:
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint='Set PGM4_CACHE_BACKEND to a shared cache (e.g. memcached) '
+             'when running more than one worker process, or processes keep '
+             'serving stale tag indexes, feeds, posting lists and '
+             'dashboards.',
+        id='pgm4app.W001')]
+
+
+@register(deploy=True)
+def check_job_worker(app_configs, **kwargs):
+    """
+    Some jobs (view count merges, revisions) are queued even with
+    JOBS_RUN_INLINE, see pgm4app.jobs.
+    """
+    if not settings.JOBS_RUN_INLINE:
+        return []
+    return [Warning(
+        'View count merges and revisions are queued even with inline jobs.',
+        hint='Run "django-admin run_jobs", or "django-admin run_jobs --once" '
+             'from cron, or view counts stop growing and edits get no '
+             'revisions.',
+        id='pgm4app.W002')]
@@ -0,0 +1,83 @@
+"""
+The sections of the home page (hot, newest and unanswered questions, top
+tags and top users) are built by refresh(), run by the refresh_dashboard
+command or the "dashboard.refresh" job, and stored in the cache as one
+snapshot of plain dicts. A request reads the snapshot with a single cache
+get and renders it without touching the database.
+
+A snapshot older than DASHBOARD_MAX_AGE seconds is still served
+(stale-while-revalidate). The first request that sees it stale takes a
+cache lock and queues a refresh, all others keep serving the old snapshot
+until the new one is stored, so there is no thundering herd of rebuilds.
+With JOBS_RUN_INLINE the refresh runs in the request that took the lock.
+
+When there is no snapshot at all (e.g. after a deploy with a process local
+cache), the request that takes the lock builds it, and all others render a
+placeholder meanwhile.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from pgm4app.jobs import enqueue
+from pgm4app.models import Content, Tag
+
+SNAPSHOT_KEY = 'dashboard:snapshot'
+LOCK_KEY = 'dashboard:lock'
+
+
+def _questions(queryset):
+    return [{'title': q.title, 'url': q.get_absolute_url(),
+             'username': q.user.username if q.user else '',
+             'points': q.points, 'count_answers': q.count_answers,
+             'is_answered': q.accepted_answer_id is not None,
+             'created': q.created}
+            for q in queryset.headers()[:settings.DASHBOARD_SECTION_SIZE]]
+
+
+def build_sections():
+    size = settings.DASHBOARD_SECTION_SIZE
+    questions = Content.objects.public().questions()
+    tags = Tag.objects.annotate(count=Count('content')).filter(count__gt=0)\
+        .order_by('-count', 'slug')[:size]
+    users = Content.objects.public().filter(user__isnull=False)\
+        .values('user__username').annotate(points=Sum('points'))\
+        .filter(points__gt=0).order_by('-points')[:size]
+    return {
+        'hot': _questions(questions.order('hot')),
+        'new': _questions(questions.order('new')),
+        'unanswered': _questions(
+            questions.filter(count_answers=0).order_by('-created')),
+        'tags': [{'slug': t.slug, 'name': t.name, 'count': t.count}
+                 for t in tags],
+        'users': [{'username': u['user__username'], 'points': u['points']}
+                  for u in users],
+    }
+
+
+def refresh():
+    """Build all sections and replace the snapshot in one cache set."""
+    snapshot = {'built': time.time(), 'sections': build_sections()}
+    cache.set(SNAPSHOT_KEY, snapshot, None)
+    cache.delete(LOCK_KEY)
+    return snapshot
+
+
+def get_sections():
+    """
+    Return the sections of the current snapshot, or None while the first
+    snapshot is being built. Builds or refreshes the snapshot if it is
+    missing or stale and no other request did so in the last
+    DASHBOARD_LOCK_TIMEOUT seconds.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None or \
+            time.time() - snapshot['built'] > settings.DASHBOARD_MAX_AGE:
+        if cache.add(LOCK_KEY, 1, settings.DASHBOARD_LOCK_TIMEOUT):
+            if snapshot is None:
+                snapshot = refresh()
+            else:
+                enqueue('dashboard.refresh', dedup_key='dashboard')
+    return snapshot and snapshot['sections']
@@ -0,0 +1,163 @@
+"""
+Atom feeds of the new and hot question lists and of every tag.
+
+A rendered feed is cached together with the version number it was built
+from. Publishing, editing, hiding or retagging a question bumps the version
+of the question lists and of its tags (see pgm4app.signals), so the next
+request renders the feed again. Votes only reorder the hot list, which is
+picked up when the cached feed expires.
+
+A poll is a single cache get_many() of the feed and its version, and a
+client sending the ETag or Last-Modified of the cached feed gets a 304 Not
+Modified without a body.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.http.response import HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import parse_etags, parse_http_date_safe
+from django.utils.translation import ugettext as _, ugettext_lazy
+
+from pgm4app.models import Content, Tag
+from pgm4app.rendering import attach_html
+
+VERSION_KEY = 'feeds:version'
+
+
+def tag_version_key(slug):
+    return 'feeds:version:tag:{}'.format(slug)
+
+
+def invalidate_feeds(tag_slugs=()):
+    """Make all feeds that may show questions with these tags stale."""
+    for key in [VERSION_KEY] + [tag_version_key(s) for s in tag_slugs]:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+class CachedAtomFeed(Feed):
+    feed_type = Atom1Feed
+    description_template = 'pgm4app/feed_item_description.html'
+
+    def cache_key(self, **kwargs):
+        raise NotImplementedError
+
+    def version_keys(self, **kwargs):
+        return [VERSION_KEY]
+
+    def __call__(self, request, *args, **kwargs):
+        key = self.cache_key(**kwargs)
+        version_keys = self.version_keys(**kwargs)
+        cached = cache.get_many([key] + version_keys)
+        versions = [cached.get(k, 0) for k in version_keys]
+
+        entry = cached.get(key)
+        if entry is None or entry['versions'] != versions:
+            response = super().__call__(request, *args, **kwargs)
+            entry = {'versions': versions, 'content': response.content,
+                     'content_type': response['Content-Type'],
+                     'etag': '"{}"'.format(
+                         hashlib.md5(response.content).hexdigest()),
+                     'last_modified': response['Last-Modified']}
+            cache.set(key, entry, settings.ATOM_FEED_CACHE_TIMEOUT)
+
+        if self.is_not_modified(request, entry):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry['content'],
+                                    content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = entry['last_modified']
+        return response
+
+    @staticmethod
+    def is_not_modified(request, entry):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # CompressionMiddleware appends the encoding to the ETag.
+            etags = [re.sub(r';(gzip|br)$', '', etag)
+                     for etag in parse_etags(if_none_match)]
+            return '*' in etags or entry['etag'].strip('"') in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        last_modified = parse_http_date_safe(entry['last_modified'])
+        return bool(if_modified_since and
+                    last_modified <= if_modified_since)
+
+    def get_items(self, queryset):
+        """Only load what the feed shows, tags and bodies in one extra
+        query each."""
+        return attach_html(list(
+            queryset.select_related('user')
+            .only('pk', 'content_type', 'title', 'slug', 'text_hash',
+                  'created', 'edited', 'last_answered', 'user__username')
+            .prefetch_related('tags')[:settings.ATOM_FEED_ITEMS]))
+
+    def item_title(self, item):
+        return item.title
+
+    def item_pubdate(self, item):
+        return item.created
+
+    def item_updateddate(self, item):
+        return item.last_activity or item.created
+
+    def item_author_name(self, item):
+        return item.user.username if item.user_id else None
+
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
+
+class QuestionsFeed(CachedAtomFeed):
+    """The "new" and "hot" question lists."""
+    titles = {'new': ugettext_lazy('Newest questions'),
+              'hot': ugettext_lazy('Hot questions')}
+
+    def cache_key(self, order):
+        return 'feeds:questions:{}'.format(order)
+
+    def get_object(self, request, order):
+        return order
+
+    def title(self, order):
+        return self.titles[order]
+
+    def link(self, order):
+        return '{}?order={}'.format(reverse('question-list'), order)
+
+    def items(self, order):
+        return self.get_items(
+            Content.objects.public().questions().order(order))
+
+
+class TagQuestionsFeed(CachedAtomFeed):
+    """The newest questions with a tag."""
+
+    def cache_key(self, slug):
+        return 'feeds:tag:{}'.format(slug)
+
+    def version_keys(self, slug):
+        return [tag_version_key(slug)]
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Tag, slug=slug)
+
+    def title(self, tag):
+        return _('Questions about {}').format(tag.name)
+
+    def link(self, tag):
+        return reverse('tag-detail', args=[tag.slug])
+
+    def items(self, tag):
+        return self.get_items(
+            tag.content.public().questions().order_by('-created'))
@@ -1,17 +1,55 @@
 from django import forms
+from django.core.urlresolvers import reverse_lazy
 from django.utils.translation import ugettext_lazy as _
 
 from pgm4app.models import Content, Tag
 
 
+class TagSlugsInput(forms.TextInput):
+    """
+    A text input for space separated tag slugs, completed by the tag
+    autocomplete endpoint. Unlike a select or checkbox widget it never
+    renders the list of all tags.
+    """
+
+    def format_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return ' '.join(str(v) for v in value)
+        return value
+
+    def render(self, name, value, attrs=None):
+        return super().render(name, self.format_value(value), attrs)
+
+    def value_from_datadict(self, data, files, name):
+        value = data.get(name, '')
+        return [slug for slug in value.replace(',', ' ').split() if slug]
+
+
+class TagSlugsField(forms.ModelMultipleChoiceField):
+    """
+    Select tags by slug. Only the submitted slugs are looked up, in a single
+    query, when the form is validated.
+    """
+    widget = TagSlugsInput
+    default_error_messages = {
+        'invalid_choice': _('There is no tag "%(value)s".'),
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Tag.objects.all())
+        super().__init__(to_field_name='slug', **kwargs)
+
+
 class AskForm(forms.ModelForm):
+    tags = TagSlugsField(required=False, label='')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.fields['title'].widget = forms.Textarea(
             attrs={'placeholder': self.fields['title'].label,
-                   'class': 'no-newlines content-title'})
+                   'class': 'no-newlines content-title',
+                   'data-similar-url': reverse_lazy('question-similar')})
         self.fields['title'].label = ''
 
         self.fields['text'].widget = forms.Textarea(
@@ -19,9 +57,15 @@ class AskForm(forms.ModelForm):
                    'class': 'content-text'})
         self.fields['text'].label = ''
 
-        self.fields['tags'].widget = forms.CheckboxSelectMultiple()
-        self.fields['tags'].label = ''
-        self.fields['tags'].queryset = Tag.objects.all()
+        self.fields['tags'].widget.attrs.update({
+            'placeholder': _('Tags, separated by spaces'),
+            'class': 'content-tags',
+            'autocomplete': 'off',
+            'data-autocomplete-url': reverse_lazy('tag-autocomplete')})
+        if self.instance.pk and 'tags' not in self.data:
+            self.initial['tags'] = list(
+                self.instance.tags.order_by('slug')
+                .values_list('slug', flat=True))
 
     class Meta:
         fields = ['title', 'text', 'tags']
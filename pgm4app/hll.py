@@ -0,0 +1,62 @@
+"""
+HyperLogLog sketches to estimate the number of distinct values seen, in
+a fixed amount of memory: 2 ** precision one byte registers, 4 KB at the
+default precision of 12, for a standard error of 1.04 / sqrt(2 ** 12),
+about 1.6%. Sketches of the same precision merge by taking the maximum of
+every register, so merging is commutative and idempotent, and a value
+added to several sketches is still counted once.
+"""
+import hashlib
+import math
+import zlib
+
+_POWERS = [2.0 ** -i for i in range(65)]
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError('Precision must be between 4 and 16.')
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers or self.size)
+        if len(self.registers) != self.size:
+            raise ValueError('Expected {} registers.'.format(self.size))
+
+    def add(self, value):
+        """Add a str or bytes value."""
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        x = int.from_bytes(hashlib.sha1(value).digest()[:8], 'big')
+        bits = 64 - self.precision
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, other):
+        """Merge another sketch into this one."""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision.')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Return the estimated number of distinct values added."""
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(_POWERS[r]
+                                             for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """The registers, compressed. Sparse sketches become very small."""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        return cls(precision, zlib.decompress(bytes(data)))
@@ -0,0 +1,144 @@
+"""
+A small job queue in the database, for work that doesn't have to happen
+before the response is sent: trending counters, search and feed indexes,
+rendering. No broker is needed, the run_jobs command is the worker.
+
+Handlers are registered by name (see pgm4app.tasks) and get the JSON
+payload passed to enqueue(). A job with a dedup_key is not queued again
+while another job with the same key is pending. A handler registered with
+batch=True gets the payloads of all claimed jobs of its name in one call.
+Failed jobs are retried with exponential backoff up to JOBS_MAX_ATTEMPTS
+times.
+
+With settings.JOBS_RUN_INLINE (the default) most jobs run right away in
+the calling process. Jobs that must never slow down a request (merging
+view counts, recording revisions) are queued with inline=False anyway, so
+every installation needs the worker, or "run_jobs --once" from cron.
+Without one, view counts stop growing, edits get no revisions and the
+queued view count merges pile up.
+"""
+import json
+import logging
+import os
+import socket
+import traceback
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from pgm4app.models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def register(name, batch=False):
+    """Decorator to register a job handler under a name."""
+    def decorator(func):
+        _registry[name] = (func, batch)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, dedup_key=None, delay=0, inline=None):
+    """
+    Queue a job, or run it now if settings.JOBS_RUN_INLINE is set. With
+    inline=False the job is always queued.
+    """
+    if settings.JOBS_RUN_INLINE if inline is None else inline:
+        func, batch = _registry[name]
+        if batch:
+            func([payload])
+        else:
+            func(payload)
+        return
+
+    try:
+        with transaction.atomic():
+            Job.objects.create(name=name, payload=json.dumps(payload),
+                               dedup_key=dedup_key,
+                               run_at=now() + timedelta(seconds=delay))
+    except IntegrityError:
+        pass  # A pending job with the same dedup_key will do the work.
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())[:64]
+
+
+def claim(worker, limit):
+    """
+    Mark up to limit due jobs as running by this worker and return them.
+    Jobs claimed by a worker that died more than settings.JOBS_TIMEOUT
+    seconds ago are claimed again. Claiming clears the dedup_key, so that
+    changes made while a job runs queue a new job.
+    """
+    claimable = Q(status='p', run_at__lte=now()) | \
+        Q(status='r', claimed__lt=now() - timedelta(
+            seconds=settings.JOBS_TIMEOUT))
+    ids = list(Job.objects.filter(claimable).order_by('run_at')
+               .values_list('pk', flat=True)[:limit])
+    if not ids:
+        return []
+    # Re-checked by the UPDATE, so two workers never claim the same job.
+    Job.objects.filter(claimable, pk__in=ids)\
+        .update(status='r', worker=worker, claimed=now(), dedup_key=None)
+    return list(Job.objects.filter(pk__in=ids, status='r', worker=worker)
+                .order_by('pk'))
+
+
+def _run(jobs, func, payload):
+    try:
+        with transaction.atomic():
+            func(payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %s failed', jobs[0].name)
+        for job in jobs:
+            _retry_later(job, error)
+        return 0
+    Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+    return len(jobs)
+
+
+def _retry_later(job, error):
+    job.attempts += 1
+    job.last_error = error
+    job.worker = None
+    if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+        job.status = 'f'
+    else:
+        job.status = 'p'
+        job.run_at = now() + timedelta(
+            seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+    job.save(update_fields=['attempts', 'last_error', 'worker', 'status',
+                            'run_at'])
+
+
+def run_pending(worker=None, limit=100):
+    """
+    Claim and run up to limit due jobs. Return the number of claimed jobs,
+    0 when the queue is empty.
+    """
+    jobs = claim(worker or worker_name(), limit)
+    by_name = OrderedDict()
+    for job in jobs:
+        by_name.setdefault(job.name, []).append(job)
+
+    for name, group in by_name.items():
+        if name not in _registry:
+            for job in group:
+                _retry_later(job, 'No handler registered for this job.')
+            continue
+        func, batch = _registry[name]
+        if batch:
+            _run(group, func, [json.loads(job.payload) for job in group])
+        else:
+            for job in group:
+                _run([job], func, json.loads(job.payload))
+    return len(jobs)
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+from django.test import override_settings
+
+from pgm4app.benchmarks import Timings
+from pgm4app.jobs import run_pending
+from pgm4app.models import Content
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent vote and answer writes against the configured '
+            'database profile. Run once with PGM4_DB=sqlite and once with '
+            'PGM4_DB=postgresql to compare both.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--answer-ratio', type=float, default=0.2,
+                            help='Share of writes that create an answer, the '
+                                 'rest toggle votes.')
+        parser.add_argument('--queue-jobs', action='store_true',
+                            help='Queue side effects as background jobs '
+                                 'instead of running them in the write, and '
+                                 'time draining the queue afterwards.')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        users = [User.objects.get_or_create(username='__bench{}'.format(i))[0]
+                 for i in range(threads)]
+        question = Content.objects.create(
+            content_type='q', title='Benchmark question', user=users[0])
+
+        timings = Timings()
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def worker(user):
+            local = Timings()
+            try:
+                target = Content.objects.get(pk=question.pk)
+                while time.perf_counter() < deadline:
+                    try:
+                        if random.random() < options['answer_ratio']:
+                            with local.measure('answer'):
+                                Content.objects.create(
+                                    content_type='a', parent=target,
+                                    user=user, text='Benchmark answer.')
+                        else:
+                            with local.measure('vote'):
+                                target.toggle_vote(user, random.choice([1, -1]))
+                    except DatabaseError:
+                        pass  # counted as an error by Timings
+            finally:
+                connection.close()
+                with lock:
+                    timings.merge(local)
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(u, )) for u in users]
+        with override_settings(JOBS_RUN_INLINE=not options['queue_jobs']):
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write('profile={} vendor={} threads={} seconds={:.1f}'.format(
+            settings.DB_PROFILE, connection.vendor, threads, elapsed))
+        timings.report(self.stdout.write, elapsed=elapsed)
+
+        if options['queue_jobs']:
+            start, count = time.perf_counter(), 0
+            while True:
+                claimed = run_pending(limit=500)
+                if not claimed:
+                    break
+                count += claimed
+            self.stdout.write('Ran {} queued jobs in {:.1f}s.'.format(
+                count, time.perf_counter() - start))
+
+        Content.objects.filter(parent=question).delete()
+        question.delete()
+        User.objects.filter(pk__in=[u.pk for u in users]).delete()
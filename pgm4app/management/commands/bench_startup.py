@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pgm4app.benchmarks import Timings
+
+CHILD = ('import sys, time; started = time.perf_counter(); '
+         'from pgm4app.warmup import measure_startup; '
+         'measure_startup(started, sys.argv[2:], sys.argv[1] == "1")')
+
+
+class Command(BaseCommand):
+    help = ('Start fresh worker processes with and without the warm up of '
+            'pgm4app.warmup and print the time to load the WSGI application '
+            'and to serve the first and second request of every path.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, default "/" and '
+                                 '"/questions/". Can be given several times.')
+        parser.add_argument('--imports', type=int, default=0,
+                            help='Also print the slowest N imports of a '
+                                 'cold start.')
+
+    def run_child(self, warm_up, paths, trace_imports=False):
+        env = dict(os.environ, PGM4_WARMUP='1' if warm_up else '0',
+                   DJANGO_SETTINGS_MODULE=os.environ.get(
+                       'DJANGO_SETTINGS_MODULE', 'pgm4.settings'),
+                   PYTHONPATH=os.pathsep.join(
+                       [settings.BASE_DIR] + sys.path[1:]))
+        output = subprocess.check_output(
+            [sys.executable, '-c', CHILD, '1' if trace_imports else '0'] +
+            paths, env=env, cwd=settings.BASE_DIR)
+        return json.loads(output.decode('utf-8').splitlines()[-1])
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/', '/questions/']
+        timings = Timings()
+        for _ in range(options['repeat']):
+            for mode, warm_up in (('cold', False), ('warm', True)):
+                result = self.run_child(warm_up, paths)
+                timings.add('{} load'.format(mode), result['load'])
+                seen = set()
+                for path, status, seconds in result['requests']:
+                    which = 'second' if path in seen else 'first'
+                    seen.add(path)
+                    name = '{} {} {}'.format(mode, which, path)
+                    timings.add(name, seconds)
+                    if not status.startswith(('2', '3')):
+                        timings.errors[name] = \
+                            timings.errors.get(name, 0) + 1
+        timings.report(self.stdout.write)
+
+        if options['imports']:
+            result = self.run_child(False, [], trace_imports=True)
+            self.stdout.write('\nSlowest imports of a cold start:')
+            for name, seconds in result['imports'][:options['imports']]:
+                self.stdout.write('{:<60} {:>9.2f} ms'.format(
+                    name, seconds * 1000))
@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from pgm4app.benchmarks import Timings
+from pgm4app.models import Content
+from pgm4app.views import QuestionDetailView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Render a large question thread with and without the cached '
+            'template loader and print render times and query counts. The '
+            'thread is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--answers', type=int, default=500)
+        parser.add_argument('--comments', type=int, default=2,
+                            help='Comments per answer.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        user = User.objects.create(username='__bench_thread')
+        question = Content.objects.create(
+            content_type='q', title='Benchmark thread', user=user,
+            text='A *question* with some **markdown**.')
+        for i in range(options['answers']):
+            answer = Content.objects.create(
+                content_type='a', parent=question, user=user,
+                text='Answer number *{}*.'.format(i))
+            for j in range(options['comments']):
+                Content.objects.create(
+                    content_type='c', parent=answer, user=user,
+                    text='Comment {}.'.format(j))
+
+        loaders = settings.APP_TEMPLATE_LOADERS
+        variants = [
+            ('uncached loaders', loaders),
+            ('cached loader', [('django.template.loaders.cached.Loader',
+                                loaders)]),
+        ]
+        view = QuestionDetailView.as_view()
+        factory = RequestFactory()
+        timings = Timings()
+
+        for name, variant_loaders in variants:
+            templates = [dict(settings.TEMPLATES[0])]
+            templates[0]['OPTIONS'] = dict(templates[0]['OPTIONS'],
+                                           loaders=variant_loaders)
+            with override_settings(TEMPLATES=templates):
+                for i in range(options['repeat']):
+                    request = factory.get(question.get_absolute_url())
+                    request.user = user
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = view(request, pk=question.pk,
+                                        slug=question.slug)
+                        response.render()
+                        timings.add(name, time.perf_counter() - start)
+
+            self.stdout.write('{}: {} queries, {} bytes'.format(
+                name, len(queries), len(response.content)))
+
+        timings.report(self.stdout.write)
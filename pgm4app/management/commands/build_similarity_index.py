@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+from array import array
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pgm4app.models import Content, SimilarityBucket, SimilaritySignature
+from pgm4app.similarity import band_keys, question_signature
+from pgm4app.utils import iterate_in_chunks
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the similar questions index from scratch. Signatures '
+            'are computed in parallel by a pool of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        batch_size = options['batch_size']
+        rows = iterate_in_chunks(
+            Content.objects.questions().values_list('pk', 'title', 'text'),
+            batch_size)
+
+        with transaction.atomic():
+            SimilarityBucket.objects.all().delete()
+            SimilaritySignature.objects.all().delete()
+
+            count = 0
+            with multiprocessing.Pool(options['processes']) as pool:
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        count += self.index_batch(pool, batch)
+                        batch = []
+                count += self.index_batch(pool, batch)
+
+        self.stdout.write('Indexed {} questions in {:.1f}s with {} '
+                          'processes.'.format(count,
+                                              time.perf_counter() - start,
+                                              options['processes']))
+
+    def index_batch(self, pool, rows):
+        """Compute signatures for (pk, title, text) rows in the worker
+        processes and save them with their buckets."""
+        signatures = pool.map(question_signature, rows, chunksize=64)
+        SimilaritySignature.objects.bulk_create(
+            SimilaritySignature(question_id=pk, signature=signature)
+            for pk, signature in signatures)
+        SimilarityBucket.objects.bulk_create(
+            SimilarityBucket(key=key, question_id=pk)
+            for pk, signature in signatures
+            for key in band_keys(array('I', signature)))
+        return len(signatures)
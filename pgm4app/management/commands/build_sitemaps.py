@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pgm4app.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = ('Write the sitemap index and the sitemap files for questions and '
+            'tags that changed since the last run to SITEMAP_ROOT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Write all sitemap files again.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = build_sitemaps(force=options['force'])
+        self.stdout.write('Wrote {} sitemap files in {:.1f}s.'.format(
+            len(written), time.perf_counter() - start))
+        for name in written:
+            self.stdout.write('  {}'.format(name))
@@ -0,0 +1,72 @@
+import glob
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pgm4app.profiling import read_folded
+
+
+class Command(BaseCommand):
+    help = ('Summarize the profiles written by ProfilerMiddleware: the top '
+            'functions per URL name from cProfile dumps, and for sampled '
+            'profiles the top functions plus one merged collapsed stacks file '
+            'per URL name, to feed to a flame graph tool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url_names', nargs='*',
+                            help='Only these URL names (default: all).')
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--sort', default='cumulative',
+                            help='pstats sort key, e.g. cumulative or tottime.')
+
+    def handle(self, *args, **options):
+        root = settings.PROFILER_DIR
+        if options['url_names']:
+            names = options['url_names']
+        elif os.path.isdir(root):
+            names = sorted(name for name in os.listdir(root)
+                           if os.path.isdir(os.path.join(root, name)))
+        else:
+            names = []
+
+        for name in names:
+            directory = os.path.join(root, name)
+            prof = sorted(glob.glob(os.path.join(directory, '*.prof')))
+            folded = sorted(glob.glob(os.path.join(directory, '*.folded')))
+            if prof:
+                self.report_cprofile(name, prof, options)
+            if folded:
+                self.report_samples(name, folded, options['limit'])
+
+    def report_cprofile(self, name, paths, options):
+        self.stdout.write('== {}: {} cProfile dumps'.format(name, len(paths)))
+        stats = pstats.Stats(*paths, stream=self.stdout)
+        stats.strip_dirs().sort_stats(options['sort'])\
+            .print_stats(options['limit'])
+
+    def report_samples(self, name, paths, limit):
+        stacks = read_folded(paths)
+        total = sum(stacks.values())
+        merged = os.path.join(settings.PROFILER_DIR, '{}.folded'.format(name))
+        with open(merged, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+        # A function's own samples are those where it is the innermost frame.
+        own, anywhere = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                anywhere[frame] += count
+
+        self.stdout.write('== {}: {} samples from {} dumps, collapsed stacks '
+                          'in {}'.format(name, total, len(paths), merged))
+        self.stdout.write('{:>7} {:>7}  {}'.format('own %', 'total %',
+                                                    'function'))
+        for frame, count in anywhere.most_common(limit):
+            self.stdout.write('{:>7.1f} {:>7.1f}  {}'.format(
+                100.0 * own[frame] / total, 100.0 * count / total, frame))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pgm4app.dashboard import refresh
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the home page dashboard snapshot (see '
+            'pgm4app.dashboard). Run it from cron, or keep it running with '
+            '--interval.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Rebuild every this many seconds until '
+                                 'interrupted.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.time()
+                refresh()
+                if options['verbosity'] > 1:
+                    self.stdout.write('Dashboard refreshed in {:.2f}s.'.format(
+                        time.time() - started))
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,81 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, Q
+
+from pgm4app.models import Content, ContentBody
+from pgm4app.rendering import RENDERER_VERSION, render_text, save_bodies, \
+    text_hash
+from pgm4app.utils import iterate_in_chunks
+
+
+def render_row(row):
+    """Runs in the worker processes: (pk, text) -> (pk, html, text hash)."""
+    pk, text = row
+    return pk, render_text(text), text_hash(text)
+
+
+class Command(BaseCommand):
+    help = ('Render the text of all questions and answers whose stored HTML '
+            'is missing or was rendered by an older RENDERER_VERSION, in '
+            'parallel worker processes. Rows already rendered by the current '
+            'version are skipped, so an interrupted run can simply be '
+            'started again, or continued with --start-after.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='Skip rows up to this id.')
+        parser.add_argument('--max-rate', type=float, default=0,
+                            help='Rows per second at most, to spare the '
+                                 'database (0 for no limit).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stale = Content.objects.exclude(content_type='c')\
+            .filter(pk__gt=options['start_after'])\
+            .filter(Q(body__isnull=True) |
+                    Q(body__renderer_version__lt=RENDERER_VERSION) |
+                    ~Q(body__source_hash=F('text_hash')))
+        rows = iterate_in_chunks(stale.values_list('pk', 'text'), batch_size)
+
+        # The workers only render, they never touch the database.
+        connections.close_all()
+        start = time.perf_counter()
+        count = 0
+        with multiprocessing.Pool(options['processes']) as pool:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += self.render_batch(pool, batch)
+                    self.throttle(start, count, options['max_rate'])
+                    batch = []
+            count += self.render_batch(pool, batch)
+
+        self.stdout.write('Rendered {} items in {:.1f}s with {} processes.'
+                          .format(count, time.perf_counter() - start,
+                                  options['processes']))
+
+    def render_batch(self, pool, rows):
+        """Render (pk, text) rows in the pool and store them."""
+        if not rows:
+            return 0
+        rendered = pool.map(render_row, rows, chunksize=16)
+        save_bodies([ContentBody(content_id=pk, html=html,
+                                 renderer_version=RENDERER_VERSION,
+                                 source_hash=source_hash)
+                     for pk, html, source_hash in rendered])
+        self.stdout.write('  rendered up to id {}'.format(rows[-1][0]))
+        return len(rows)
+
+    @staticmethod
+    def throttle(start, count, max_rate):
+        if max_rate:
+            ahead = count / max_rate - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
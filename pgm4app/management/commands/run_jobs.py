@@ -0,0 +1,56 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from pgm4app.jobs import run_pending, worker_name
+
+
+def work(batch_size, idle_sleep, once):
+    """Run jobs until interrupted, or until the queue is empty if once."""
+    worker = worker_name()
+    try:
+        while True:
+            if not run_pending(worker, batch_size):
+                if once:
+                    return
+                time.sleep(idle_sleep)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs (see pgm4app.jobs) in one or more '
+            'worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Jobs claimed at once by a worker.')
+        parser.add_argument('--idle-sleep', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        work_args = (options['batch_size'], options['idle_sleep'],
+                     options['once'])
+        if options['processes'] == 1:
+            work(*work_args)
+            return
+
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        workers = [multiprocessing.Process(target=work, args=work_args)
+                   for _ in range(options['processes'])]
+        for process in workers:
+            process.start()
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            for process in workers:
+                process.join()
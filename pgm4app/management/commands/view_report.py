@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pgm4app.models import Content
+from pgm4app.viewcounts import daily_viewers, unique_viewers
+
+
+class Command(BaseCommand):
+    help = ('Print the estimated unique viewers of a question per day, and '
+            'over the whole period (see pgm4app.viewcounts).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', type=int)
+        parser.add_argument('--days', type=int, default=14)
+
+    def handle(self, *args, **options):
+        try:
+            question = Content.objects.questions().get(
+                pk=options['question'])
+        except Content.DoesNotExist:
+            raise CommandError('No question {}.'.format(options['question']))
+
+        days = daily_viewers(question, options['days'])
+        for day, estimate in days:
+            self.stdout.write('{}  {:>9}'.format(day, estimate))
+        self.stdout.write('{:<10}  {:>9}'.format('unique', unique_viewers(
+            question, days[0][0], days[-1][0])))
+        self.stdout.write('{:<10}  {:>9}'.format('count_views',
+                                                 question.count_views))
@@ -0,0 +1,257 @@
+import gzip
+import hashlib
+import io
+import os
+import random
+import re
+import zlib
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip alone is fine
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """
+    Return a dict of encoding name to quality value from an Accept-Encoding
+    header, e.g. "gzip, br;q=0.9" -> {'gzip': 1.0, 'br': 0.9}.
+    """
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Return "br", "gzip" or None for the client's Accept-Encoding."""
+    accepted = parse_accept_encoding(header)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=settings.COMPRESS_BROTLI_QUALITY)
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0,
+                       compresslevel=settings.COMPRESS_GZIP_LEVEL) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def compress_sequence(sequence, encoding):
+    """Compress an iterable of bytes chunk by chunk, yielding output early."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESS_BROTLI_QUALITY)
+        for chunk in sequence:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer.
+        compressor = zlib.compressobj(settings.COMPRESS_GZIP_LEVEL,
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in sequence:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class CompressionMiddleware(object):
+    """
+    Compress responses with brotli (if the module is installed) or gzip,
+    depending on what the client accepts.
+
+    Short bodies, non-text content types and responses that already have a
+    Content-Encoding (e.g. precompressed static files) are left alone.
+    Streaming responses are compressed chunk by chunk as they are sent.
+
+    Compressed bodies are kept in the cache under a hash of the uncompressed
+    body, so a hot page whose HTML doesn't change is only compressed once
+    and later requests only pay for hashing it. When Django's
+    UpdateCacheMiddleware is listed above this middleware, the page cache
+    stores the compressed variant directly (keyed on Accept-Encoding via the
+    Vary header).
+
+    Responses that contain the CSRF token (a template used {% csrf_token %}
+    or the CSRF cookie is set) are sent uncompressed: compressing a secret
+    next to text an attacker can inject makes it guessable from the
+    compressed size (BREACH).
+    """
+    compressible_types = re.compile(
+        r'^(text/|application/(json|javascript|xml|atom\+xml|rss\+xml)|'
+        r'image/svg\+xml)')
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if getattr(response, 'file_to_stream', None) is not None:
+            return response  # leave FileResponse to the server's sendfile
+        if request.META.get('CSRF_COOKIE_USED') \
+                or settings.CSRF_COOKIE_NAME in response.cookies:
+            return response
+        if not response.streaming \
+                and len(response.content) < settings.COMPRESS_MIN_SIZE:
+            return response
+
+        content_type = response.get('Content-Type', '')
+        if not self.compressible_types.match(content_type):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # The compressed size is unknown until everything was sent.
+            response.streaming_content = compress_sequence(
+                response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed = self.get_compressed(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub('"$', ';{}"'.format(encoding),
+                                      response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
+
+    def get_compressed(self, content, encoding):
+        if not settings.COMPRESS_CACHE_TIMEOUT:
+            return compress(content, encoding)
+
+        key = 'compressed:{}:{}'.format(
+            encoding, hashlib.sha1(content).hexdigest())
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = compress(content, encoding)
+            cache.set(key, compressed, settings.COMPRESS_CACHE_TIMEOUT)
+        return compressed
+
+
+def user_cache_key(user_id):
+    return 'auth-user:{}'.format(user_id)
+
+
+def get_cached_user(request):
+    """
+    Return the user for the request's session, like auth.get_user(), but
+    read the user object from the cache. The session auth hash is verified
+    against the cached user, so a password change (which also clears the
+    cache entry, see pgm4app.signals) still logs out other sessions. Without
+    settings.AUTH_USER_CACHE_TIMEOUT this is auth.get_user().
+    """
+    if not settings.AUTH_USER_CACHE_TIMEOUT:
+        return auth.get_user(request)
+
+    try:
+        user_id = request.session[auth.SESSION_KEY]
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated():
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+    user.backend = backend_path
+    return user
+
+
+class CachedAuthenticationMiddleware(object):
+    """
+    Drop-in replacement for django.contrib.auth's AuthenticationMiddleware
+    that resolves request.user from the cache instead of querying auth_user
+    on every request. Together with cached sessions this makes reads by
+    anonymous and logged in users cost no auth queries in the common case.
+    Both need a cache shared by all processes (see settings.CACHES).
+    """
+
+    def process_request(self, request):
+        assert hasattr(request, 'session'), (
+            "CachedAuthenticationMiddleware requires SessionMiddleware.")
+
+        def get_user():
+            if not hasattr(request, '_cached_user'):
+                request._cached_user = get_cached_user(request)
+            return request._cached_user
+
+        request.user = SimpleLazyObject(get_user)
+
+
+class ProfilerMiddleware(object):
+    """
+    Run a share of requests (settings.PROFILER_SAMPLE_RATE), and requests
+    by staff users with an "X-Profile: 1" header, under the profiler from
+    pgm4app.profiling. Staff get the dump's path in an X-Profile response
+    header. Unless settings.PROFILER_ENABLED is set the middleware removes
+    itself at startup and costs nothing.
+
+    Must be the last middleware, because it calls the view itself. Template
+    responses are rendered inside the profiler.
+    """
+
+    def __init__(self):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        requested = request.META.get('HTTP_X_PROFILE') == '1' \
+            and request.user.is_staff
+        if not requested and random.random() >= settings.PROFILER_SAMPLE_RATE:
+            return None
+
+        def call_view():
+            response = view_func(request, *view_args, **view_kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            return response
+
+        from pgm4app.profiling import profile
+        match = request.resolver_match
+        response, path = profile(call_view, match.url_name if match else None)
+        if requested:
+            response['X-Profile'] = os.path.relpath(
+                path, settings.PROFILER_DIR)
+        return response
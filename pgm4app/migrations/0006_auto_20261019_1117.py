@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0005_auto_20160508_1927'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('q', 'question'), ('t', 'tag')], max_length=1)),
+                ('object_id', models.PositiveIntegerField()),
+                ('resolution', models.CharField(max_length=1)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('bucket', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trendcounter',
+            unique_together=set([('kind', 'resolution', 'object_id', 'slot')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='trendcounter',
+            index_together=set([('kind', 'resolution', 'bucket')]),
+        ),
+    ]
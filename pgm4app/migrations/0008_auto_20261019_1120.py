@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:20
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pgm4app', '0007_auto_20261019_1119'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LastSeen',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seen', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='last_answered',
+            field=models.DateTimeField(db_index=True, default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lastseen',
+            name='question',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='last_seen', to='pgm4app.Content'),
+        ),
+        migrations.AddField(
+            model_name='lastseen',
+            name='user',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lastseen',
+            unique_together=set([('user', 'question')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0009_auto_20261019_1121'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentBody',
+            fields=[
+                ('content', models.OneToOneField(editable=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='body', serialize=False, to='pgm4app.Content')),
+                ('html', models.TextField(blank=True, editable=False)),
+                ('renderer_version', models.PositiveSmallIntegerField(default=0, editable=False)),
+            ],
+        ),
+    ]
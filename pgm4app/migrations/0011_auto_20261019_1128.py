@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0010_contentbody'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='content',
+            name='content_type',
+            field=models.CharField(choices=[('q', 'question'), ('a', 'answer'), ('c', 'comment')], db_index=True, editable=False, max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='is_deleted',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='is_hidden',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_accepted_answer(apps, schema_editor):
+    Content = apps.get_model('pgm4app', 'Content')
+    for pk, parent_id in Content.objects.filter(
+            content_type='a', is_accepted=True).values_list('pk', 'parent_id'):
+        Content.objects.filter(pk=parent_id).update(accepted_answer_id=pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0012_auto_20261019_1130'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='accepted_answer',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pgm4app.Content'),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='is_accepted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(set_accepted_answer, migrations.RunPython.noop),
+    ]
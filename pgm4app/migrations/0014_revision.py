@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0013_auto_20261019_1133'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('replaced', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('is_full', models.BooleanField(default=False, editable=False)),
+                ('data', models.BinaryField()),
+                ('base_crc', models.BigIntegerField(default=0, editable=False)),
+                ('size', models.PositiveIntegerField(default=0, editable=False)),
+                ('content', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='pgm4app.Content')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='revision',
+            index_together=set([('content', 'replaced')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 11:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0014_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(editable=False, null=True)),
+                ('registers', models.BinaryField()),
+                ('estimate', models.PositiveIntegerField(default=0, editable=False)),
+                ('question', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pgm4app.Content')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='viewsketch',
+            unique_together=set([('question', 'day')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 12:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0015_viewsketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentbody',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-19 12:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from pgm4app.models import text_hash
+
+
+def set_text_hash(apps, schema_editor):
+    Content = apps.get_model('pgm4app', 'Content')
+    for pk, text in Content.objects.values_list('pk', 'text').iterator():
+        Content.objects.filter(pk=pk).update(text_hash=text_hash(text))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pgm4app', '0016_contentbody_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='text_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(set_text_hash, migrations.RunPython.noop),
+    ]
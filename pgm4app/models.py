@@ -1,7 +1,10 @@
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.db import models, IntegrityError
-from django.db.models import Count, When, Case, Q, Sum, F
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, When, Case, Q, Sum, F, Value
 from django.utils.text import slugify
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
@@ -11,6 +14,11 @@ def validate_is_question():
     pass
 
 
+def text_hash(text):
+    """The hash of a text stored in Content.text_hash, see pgm4app.rendering."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
 class Tag(models.Model):
     name = models.CharField(
         max_length=30, blank=False, null=False, editable=True,
@@ -19,6 +27,8 @@ class Tag(models.Model):
         error_messages={'blank': _('Please write a question.')})
     slug = models.SlugField(
         max_length=30, null=False, blank=True, editable=False)
+    count_followers = models.PositiveIntegerField(
+        null=False, default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -40,12 +50,28 @@ class ContentQuerySet(models.QuerySet):
             return self.order_by('-created')
         elif name == 'top':
             return self.order_by('-points')
+        elif name == 'trending':
+            return self.trending()
+
+    def trending(self):
+        """
+        Return only currently trending questions, in trending order. See
+        pgm4app.trending for how the ranking is kept.
+        """
+        from pgm4app.trending import trending_question_ids
+        ids = trending_question_ids()
+        if not ids:
+            return self.none()
+        position = Case(*[When(pk=pk, then=Value(i))
+                          for i, pk in enumerate(ids)],
+                        output_field=models.IntegerField())
+        return self.filter(pk__in=ids).order_by(position)
 
     def questions(self):
         return self.filter(content_type='q')
 
     def answers(self):
-        args = ['is_accepted', '-timepoints']
+        args = ['-is_accepted', '-timepoints', '-pk']
         return self.filter(content_type='a').order_by(*args)
 
     def comments(self):
@@ -54,6 +80,13 @@ class ContentQuerySet(models.QuerySet):
     def public(self):
         return self.filter(is_hidden=False, is_deleted=False)
 
+    def headers(self):
+        """
+        Load everything a list of items shows, but not the text body, which
+        can be up to 100000 characters. The text is fetched on access.
+        """
+        return self.defer('text').select_related('user')
+
     def hidden(self):
         return self.filter(is_hidden=True)
 
@@ -80,7 +113,20 @@ class ContentQuerySet(models.QuerySet):
         :param tag_slug:
         :return:
         """
-        return self.filter(tag__slug=tag_slug)
+        return self.filter(tags__slug=tag_slug)
+
+    def bulk_create_children(self, children, batch_size=None):
+        """
+        Create many answers or comments with bulk_create() and count them on
+        their parents with one UPDATE per parent. Like bulk_create(), this
+        sends no signals.
+        """
+        for child in children:
+            child.text_hash = text_hash(child.text)
+        with transaction.atomic(using=self.db):
+            children = self.bulk_create(children, batch_size)
+            Content.count_on_parents(children)
+        return children
 
     def without_children(self):
         return self.annotate(count=Count('children')).filter(count=0)
@@ -95,15 +141,15 @@ class ContentQuerySet(models.QuerySet):
         return self.all().public().questions().without_children()
 
     def questions_without_accepted_answer(self):
-        return self.all().public().questions().annotate(count=Count(Case(
-            When(children__is_accepted=True, then=1),
-            output_field=models.IntegerField()))).filter(count__gt=0)
+        return self.all().public().questions()\
+            .filter(accepted_answer__isnull=True)
 
 
 class Content(models.Model):
 
     content_type = models.CharField(
-        max_length=1, choices=content_type_choices, null=False, editable=False)
+        max_length=1, choices=content_type_choices, null=False, editable=False,
+        db_index=True)
     slug = models.SlugField(
         null=False, blank=True, default='')
     title = models.CharField(
@@ -114,6 +160,10 @@ class Content(models.Model):
     text = models.TextField(
         max_length=100000, blank=True, null=False, editable=True, default='',
         verbose_name='')
+    # Set on save, so that the rendered body can be checked against the
+    # text without loading the text (see pgm4app.rendering).
+    text_hash = models.CharField(max_length=40, null=False, blank=True,
+                                 default='', editable=False)
     ip = models.GenericIPAddressField(blank=True, null=True, default=None,
                                       editable=False)
     parent = models.ForeignKey(
@@ -125,21 +175,32 @@ class Content(models.Model):
     tags = models.ManyToManyField(
         Tag, related_name='content', blank=True, editable=True)
 
-    is_hidden = models.BooleanField(default=False, editable=False)  # by user
-    is_deleted = models.BooleanField(default=False, editable=True)  # by admin
-    is_accepted = models.BooleanField(default=False, editable=True)  # by asker
+    is_hidden = models.BooleanField(  # by user
+        default=False, editable=False, db_index=True)
+    is_deleted = models.BooleanField(  # by admin
+        default=False, editable=True, db_index=True)
+    is_accepted = models.BooleanField(  # by asker, see accept()
+        default=False, editable=False)
+    # The accepted answer of a question, so that lists can show it without
+    # looking at the answers. Kept in sync with is_accepted by accept().
+    accepted_answer = models.ForeignKey(
+        'self', models.SET_NULL, related_name='+',
+        null=True, default=None, editable=False)
 
     created = models.DateTimeField(null=False, editable=False, default=now)
     # Show auth user questions that were edited since their last visit,
     edited = models.DateTimeField(null=True, default=None, editable=False)
     # Show auth user questions that have new answers since their last visit,
-    last_answered = models.DateTimeField(null=True, default=None, editable=False)
+    last_answered = models.DateTimeField(null=True, default=None,
+                                         editable=False, db_index=True)
 
     up = models.PositiveIntegerField(null=False, editable=True, default=0)
     down = models.PositiveIntegerField(null=False, editable=True, default=0)
     points = models.PositiveIntegerField(null=False, editable=True, default=0)
     timepoints = models.BigIntegerField(null=False, editable=False, default=0)
 
+    # Grows with the estimated number of unique viewers, see
+    # pgm4app.viewcounts.
     count_views = models.PositiveIntegerField(null=False, default=0)
     count_answers = models.PositiveIntegerField(null=False, default=0)
     count_comments = models.PositiveIntegerField(null=False, default=0)
@@ -161,28 +222,63 @@ class Content(models.Model):
         else:
             return 'Undefined content type {}: "{}"'.format(self.pk, self.title)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The text as loaded, to record a revision when an edit changes it
+        # (see pgm4app.signals). None if the text was deferred.
+        instance._loaded_text = instance.__dict__.get('text')
+        # The same for the flags that take a question out of tag queries.
+        instance._loaded_flags = (instance.__dict__.get('is_hidden'),
+                                  instance.__dict__.get('is_deleted'))
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            # This may be an edit or just a counter update.
-            pass
-        else:
-            # For new items, set slug and count replies on parent.
-            if self.is_question:
-                self.slug = slugify(self.title)
-            if self.is_answer:
-                self.parent.count_answers = F('count_answers') + 1
-                self.parent.save()
-            if self.is_comment:
-                self.parent.count_comments = F('count_comments') + 1
-                self.parent.save()
-
-        if self.is_answer and self.is_accepted:
-            # Make sure there is no other accepted answer for this question.
-            if self.parent.children\
-                   .filter(is_accepted=True).exclude(pk=self.pk).exists():
-                raise IntegrityError("Question can't have more "
-                                     "than one accepted answer")
-        super().save(*args, **kwargs)
+        is_new = self.pk is None
+        if is_new and self.is_question:
+            self.slug = slugify(self.title)
+        if 'text' in self.__dict__:
+            self.text_hash = text_hash(self.text)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'text' in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['text_hash']
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new and not self.is_question:
+                Content.count_on_parents([self])
+
+        if is_new and self.is_answer:
+            from pgm4app.jobs import enqueue
+            from pgm4app.tasks import trending_event
+            enqueue('trending.record', trending_event(
+                self.parent_id, settings.TRENDING_ANSWER_WEIGHT))
+
+    @classmethod
+    def count_on_parents(cls, children):
+        """
+        Count new answers and comments on their parents, with at most one
+        UPDATE of only the counter columns (and last_answered) per parent,
+        parents with the same new counts share one. The parents are not
+        loaded or saved, so concurrent vote or view count updates
+        and the parent's text are never overwritten.
+        """
+        deltas = {}
+        for child in children:
+            delta = deltas.setdefault(child.parent_id, [0, 0])
+            delta[0 if child.is_answer else 1] += 1
+
+        parents_by_delta = {}
+        for parent_id, delta in deltas.items():
+            parents_by_delta.setdefault(tuple(delta), []).append(parent_id)
+        for (answers, comments), parent_ids in parents_by_delta.items():
+            values = {}
+            if answers:
+                values['count_answers'] = F('count_answers') + answers
+                values['last_answered'] = now()
+            if comments:
+                values['count_comments'] = F('count_comments') + comments
+            cls.objects.filter(pk__in=parent_ids).update(**values)
 
     @classmethod
     def get_content_type_id(cls, name):
@@ -210,20 +306,68 @@ class Content(models.Model):
             self.is_upvoted = vote and vote.value == 1
             self.is_downvoted = vote and vote.value == -1
 
-    def count_view(self):
-        """Increase the view counter by one."""
-        self.count_views += 1
-        self.save(update_fields=['count_views'])
+    @classmethod
+    def attach_user_votes(cls, content_list, user):
+        """
+        Set "is_upvoted" and "is_downvoted" on all Content objects in the list
+        with a single query for the user's votes.
+        """
+        content_list = list(content_list)
+        if not user.is_authenticated() or not content_list:
+            return content_list
+
+        content_id_list = [x.id for x in content_list]
+        votes_qs = Vote.objects.filter(user=user, content_id__in=content_id_list)
+        votes = dict(votes_qs.values_list('content_id', 'value'))
+        for obj in content_list:
+            obj.is_upvoted = votes.get(obj.id, 0) == 1
+            obj.is_downvoted = votes.get(obj.id, 0) == -1
+
+        return content_list
 
     def answers(self, public_only=True):
         if self.content_type == 'q':
             qs = Content.objects.answers()
             if public_only:
                 qs = qs.public()
+            if self.accepted_answer_id:
+                qs = qs.order_by(Case(
+                    When(pk=self.accepted_answer_id, then=Value(0)),
+                    default=Value(1), output_field=models.IntegerField()),
+                    '-timepoints', '-pk')
             return qs.filter(parent=self.pk)
         else:
             raise ValueError('Only questions have answers.')
 
+    def accept(self, accepted=True):
+        """
+        Make this answer the accepted answer of its question, replacing any
+        previously accepted one, or with accepted=False, unaccept it.
+        """
+        if not self.is_answer:
+            raise ValueError('Only answers can be accepted.')
+        with transaction.atomic():
+            # Lock the question, so concurrent accepts happen one by one.
+            question = Content.objects.select_for_update()\
+                .only('accepted_answer').get(pk=self.parent_id)
+            if accepted:
+                Content.objects.filter(parent_id=question.pk,
+                                       is_accepted=True)\
+                    .exclude(pk=self.pk).update(is_accepted=False)
+                question.accepted_answer_id = self.pk
+            elif question.accepted_answer_id == self.pk:
+                question.accepted_answer_id = None
+            Content.objects.filter(pk=self.pk).update(is_accepted=accepted)
+            Content.objects.filter(pk=question.pk)\
+                .update(accepted_answer_id=question.accepted_answer_id)
+        self.is_accepted = accepted
+
+    @property
+    def last_activity(self):
+        """When the question was last edited or answered, or None."""
+        return max(filter(None, [self.edited, self.last_answered]),
+                   default=None)
+
     def comments(self, public_only=True):
         qs = Content.objects.all()
 
@@ -303,12 +447,15 @@ class Content(models.Model):
             v = Vote.objects.get(user=user, content=self)
         except Vote.DoesNotExist:
             Vote.objects.create(user=user, content=self, value=value)
+            voted = True
         else:
             if v.value == value:
                 v.delete()
+                voted = False
             else:
                 v.value = value
                 v.save(update_fields=['value'])
+                voted = True
 
         self.up = self.votes.count_upvotes()
         self.down = self.votes.count_downvotes()
@@ -316,6 +463,173 @@ class Content(models.Model):
         self.set_timepoints()
         self.save(update_fields=['up', 'down', 'points', 'timepoints'])
 
+        if voted:
+            from pgm4app.jobs import enqueue
+            from pgm4app.tasks import trending_event
+            enqueue('trending.record', trending_event(
+                self.get_question().pk, settings.TRENDING_VOTE_WEIGHT))
+
+
+class LastSeenQuerySet(models.QuerySet):
+
+    def mark_seen(self, user, questions, when=None):
+        """
+        Record that the user has seen the questions now. Reads the stored
+        times with one query, then UPDATEs only those that were seen before
+        the question's last activity and INSERTs the ones never seen, so
+        viewing a question again without news writes nothing.
+        """
+        when = when or now()
+        questions = list(questions)
+        seen = dict(self.filter(user=user,
+                                question_id__in=[q.pk for q in questions])
+                    .values_list('question_id', 'seen'))
+        outdated = [q.pk for q in questions if q.pk in seen and
+                    q.last_activity and q.last_activity >= seen[q.pk]]
+        if outdated:
+            self.filter(user=user, question_id__in=outdated)\
+                .update(seen=when)
+        missing = set(q.pk for q in questions) - set(seen)
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                self.bulk_create(LastSeen(user=user, question_id=pk, seen=when)
+                                 for pk in missing)
+        except IntegrityError:
+            pass  # a parallel request of the same user was faster
+
+    def annotate_unread(self, user, questions):
+        """
+        Set "has_unread" on every question in the list that the user has
+        seen before and that was edited or answered since. Runs one query.
+        """
+        questions = list(questions)
+        if not user.is_authenticated() or not questions:
+            return questions
+
+        seen = dict(self.filter(user=user,
+                                question_id__in=[q.pk for q in questions])
+                    .values_list('question_id', 'seen'))
+        for question in questions:
+            last_seen = seen.get(question.pk)
+            activity = question.last_activity
+            question.has_unread = bool(last_seen and activity and
+                                       activity > last_seen)
+        return questions
+
+
+class LastSeen(models.Model):
+    """When a user last looked at a question."""
+    user = models.ForeignKey(
+        User, models.CASCADE, related_name='+', null=False, editable=False)
+    question = models.ForeignKey(
+        Content, models.CASCADE, related_name='last_seen', null=False,
+        editable=False)
+    seen = models.DateTimeField(null=False, editable=False, default=now)
+
+    objects = LastSeenQuerySet.as_manager()
+
+    class Meta:
+        unique_together = (('user', 'question'), )
+
+    def __str__(self):
+        return '{} saw {} at {}'.format(self.user_id, self.question_id,
+                                        self.seen)
+
+
+class ContentBody(models.Model):
+    """
+    The HTML rendered from Content.text, see pgm4app.rendering. It is kept
+    in its own table, so that reading lists of Content rows never moves it.
+    """
+    content = models.OneToOneField(Content, models.CASCADE, primary_key=True,
+                                   related_name='body', editable=False)
+    html = models.TextField(null=False, blank=True, editable=False)
+    renderer_version = models.PositiveSmallIntegerField(
+        null=False, default=0, editable=False)
+    source_hash = models.CharField(max_length=40, null=False, blank=True,
+                                   default='', editable=False)
+
+    def __str__(self):
+        return 'Body of {} (v{})'.format(self.content_id,
+                                         self.renderer_version)
+
+
+class Revision(models.Model):
+    """
+    A former text of a question, answer or comment, see pgm4app.revisions.
+    Stored as a compressed diff against the text that replaced it, or as
+    the compressed full text every few revisions.
+    """
+    content = models.ForeignKey(Content, models.CASCADE,
+                                related_name='revisions', editable=False)
+    # When this text was replaced by an edit.
+    replaced = models.DateTimeField(null=False, editable=False, default=now)
+    is_full = models.BooleanField(default=False, editable=False)
+    data = models.BinaryField(editable=False)
+    # CRC32 of the text the diff applies to, to detect gaps in the history.
+    base_crc = models.BigIntegerField(null=False, default=0, editable=False)
+    size = models.PositiveIntegerField(null=False, default=0, editable=False)
+
+    class Meta:
+        index_together = (('content', 'replaced'), )
+
+    def __str__(self):
+        return 'Revision of {} replaced {}'.format(self.content_id,
+                                                   self.replaced)
+
+
+class ViewSketch(models.Model):
+    """
+    A HyperLogLog sketch of the visitors of a question on one day, or of
+    all time if day is None, see pgm4app.viewcounts.
+    """
+    question = models.ForeignKey(Content, models.CASCADE, related_name='+',
+                                 editable=False)
+    day = models.DateField(null=True, editable=False)
+    registers = models.BinaryField(editable=False)  # HyperLogLog.to_bytes()
+    # The estimate when the sketch was last saved.
+    estimate = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        unique_together = (('question', 'day'), )
+
+    def __str__(self):
+        return 'Viewers of {} on {}: {}'.format(
+            self.question_id, self.day or 'all days', self.estimate)
+
+
+class TagFollow(models.Model):
+    """A user follows a tag, see pgm4app.timelines."""
+    user = models.ForeignKey(
+        User, models.CASCADE, related_name='tag_follows', editable=False)
+    tag = models.ForeignKey(
+        Tag, models.CASCADE, related_name='follows', editable=False)
+    created = models.DateTimeField(null=False, editable=False, default=now)
+
+    class Meta:
+        unique_together = (('user', 'tag'), )
+
+    def __str__(self):
+        return '{} follows {}'.format(self.user_id, self.tag_id)
+
+
+class FeedEntry(models.Model):
+    """
+    A question pushed into a user's feed timeline because it was tagged with
+    a (not too popular) tag the user follows, see pgm4app.timelines.
+    """
+    user = models.ForeignKey(
+        User, models.CASCADE, related_name='+', editable=False)
+    question = models.ForeignKey(
+        Content, models.CASCADE, related_name='+', editable=False)
+    tag = models.ForeignKey(
+        Tag, models.CASCADE, related_name='+', editable=False)
+
+    class Meta:
+        unique_together = (('user', 'question'), )
+
 
 class VoteQuerySet(models.QuerySet):
     def by(self, user):
@@ -344,6 +658,7 @@ class Vote(models.Model):
         Content, models.CASCADE, related_name='votes', null=False,
         editable=False)
     value = models.SmallIntegerField(null=False, editable=False)
+    created = models.DateTimeField(null=False, editable=False, default=now)
 
     objects = VoteQuerySet.as_manager()
 
@@ -355,3 +670,76 @@ class Vote(models.Model):
             self.user.username,
             {'-1': 'downvoted', '1': 'upvoted'}[str(self.value)],
             self.content.title)
+
+
+trend_kind_choices = (('q', 'question'), ('t', 'tag'))
+
+
+class TrendCounter(models.Model):
+    """
+    One slot of a fixed size ring buffer of event counts (votes, answers) for
+    a question or a tag. The slot for a point in time is its bucket number
+    modulo the ring size. Writing into a slot that still holds an older
+    bucket overwrites it, so old counts expire in O(1) without any cleanup
+    job, and the table never grows beyond (objects * slots) rows.
+    See pgm4app.trending.
+    """
+    kind = models.CharField(max_length=1, choices=trend_kind_choices)
+    object_id = models.PositiveIntegerField()
+    resolution = models.CharField(max_length=1)  # key of TRENDING_RINGS
+    slot = models.PositiveSmallIntegerField()
+    bucket = models.PositiveIntegerField()  # unix time // bucket seconds
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('kind', 'resolution', 'object_id', 'slot'), )
+        index_together = (('kind', 'resolution', 'bucket'), )
+
+    def __str__(self):
+        return '{} {} {}/{}: {}'.format(self.get_kind_display(),
+                                        self.object_id, self.resolution,
+                                        self.bucket, self.count)
+
+
+class SimilaritySignature(models.Model):
+    """MinHash signature of a question, see pgm4app.similarity."""
+    question = models.OneToOneField(
+        Content, models.CASCADE, primary_key=True, related_name='+')
+    signature = models.BinaryField()
+
+
+class SimilarityBucket(models.Model):
+    """One LSH band bucket a question falls into, see pgm4app.similarity."""
+    key = models.BigIntegerField(db_index=True)
+    question = models.ForeignKey(
+        Content, models.CASCADE, related_name='+')
+
+
+job_status_choices = (('p', 'pending'), ('r', 'running'), ('f', 'failed'))
+
+
+class Job(models.Model):
+    """
+    Work deferred out of the request, see pgm4app.jobs. Finished jobs are
+    deleted, failed ones are kept with their last error.
+    """
+    name = models.CharField(max_length=100, null=False)
+    payload = models.TextField(null=False, blank=True, default='')  # JSON
+    # At most one pending job per key, e.g. "body:123" to render a post.
+    dedup_key = models.CharField(
+        max_length=200, null=True, default=None, unique=True)
+    status = models.CharField(
+        max_length=1, choices=job_status_choices, null=False, default='p')
+    run_at = models.DateTimeField(null=False, default=now)
+    attempts = models.PositiveSmallIntegerField(null=False, default=0)
+    worker = models.CharField(max_length=64, null=True, default=None)
+    claimed = models.DateTimeField(null=True, default=None)
+    last_error = models.TextField(null=False, blank=True, default='')
+    created = models.DateTimeField(null=False, editable=False, default=now)
+
+    class Meta:
+        index_together = (('status', 'run_at'), )
+
+    def __str__(self):
+        return 'Job {} {} ({})'.format(self.pk, self.name,
+                                       self.get_status_display())
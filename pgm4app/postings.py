@@ -0,0 +1,186 @@
+"""
+In-process posting lists for tag queries like "python AND django NOT
+beginner". For every tag the index keeps a sorted array of the ids of the
+public questions with that tag, so a query is a few intersections, unions
+and differences of integer arrays instead of one SQL join per tag.
+
+Query syntax: tag slugs combined with AND, OR and NOT (also "-tag"), with
+NOT binding tightest and OR loosest. Tags next to each other without an
+operator are ANDed, so "?tags=python+django" works, too. A group of only
+NOT terms matches all tagged questions without those tags.
+
+Every process keeps its own copy. New tag assignments are added
+incrementally, at most every POSTINGS_REFRESH_INTERVAL seconds, by reading
+the rows of the tags table added since the last refresh, plus an overlap of
+POSTINGS_REFRESH_OVERLAP older rows: row ids are handed out when a row is
+inserted, not when it is committed. Hiding, deleting or untagging a
+question bumps a version in the cache (see pgm4app.signals), which makes
+all processes sharing the cache rebuild on their next query. Every index is
+rebuilt after POSTINGS_MAX_AGE seconds to pick up changes it missed, which
+is short when the cache is local to each process.
+"""
+import bisect
+import threading
+import time
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.text import slugify
+
+from pgm4app.models import Content
+
+VERSION_KEY = 'postings:version'
+
+
+def _contains(ids, value):
+    i = bisect.bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+def intersect(lists):
+    """Ids in all sorted lists, walking the shortest one and looking the
+    ids up in the others by bisection."""
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        result = [i for i in result if _contains(other, i)]
+    return result
+
+
+def union(lists):
+    return sorted(set().union(*lists))
+
+
+def difference(ids, lists):
+    """Ids in the sorted list ids that are in none of the lists."""
+    exclude = set().union(*lists)
+    return [i for i in ids if i not in exclude]
+
+
+def parse_query(text):
+    """
+    Return the OR groups of a query as a list of (include, exclude) lists
+    of tag slugs.
+    """
+    groups = [([], [])]
+    negate = False
+    for word in text.split():
+        operator = word.upper()
+        if operator == 'OR':
+            groups.append(([], []))
+        elif operator == 'NOT':
+            negate = True
+            continue
+        elif operator != 'AND':
+            if word.startswith('-'):
+                negate = True
+                word = word[1:]
+            slug = slugify(word)
+            if slug:
+                groups[-1][negate].append(slug)
+        negate = False
+    return [group for group in groups if group[0] or group[1]]
+
+
+class PostingIndex:
+
+    def __init__(self):
+        self.postings = {}
+        self.all = array('l')
+        self.last_row = 0
+        self.refreshed = 0
+
+    def add_rows(self, rows):
+        """
+        :param rows: iterable of (row id, tag slug, question id) tuples of
+            the tags table, in row id order.
+        """
+        for row_id, slug, question_id in rows:
+            ids = self.postings.setdefault(slug, array('l'))
+            for target in (ids, self.all):
+                i = bisect.bisect_left(target, question_id)
+                if i == len(target) or target[i] != question_id:
+                    target.insert(i, question_id)
+            self.last_row = max(self.last_row, row_id)
+        self.refreshed = time.time()
+
+    def query(self, text):
+        """Return the matching question ids, newest first."""
+        results = []
+        for include, exclude in parse_query(text):
+            if include:
+                ids = intersect([self.postings.get(s, ()) for s in include])
+            else:
+                ids = self.all
+            if exclude:
+                ids = difference(
+                    ids, [self.postings.get(s, ()) for s in exclude])
+            results.append(ids)
+        if not results:
+            return []
+        ids = results[0] if len(results) == 1 else union(results)
+        return list(reversed(ids))
+
+
+def tag_rows(after=0):
+    return Content.tags.through.objects\
+        .filter(pk__gt=after, content__content_type='q',
+                content__is_hidden=False, content__is_deleted=False)\
+        .order_by('pk').values_list('pk', 'tag__slug', 'content_id')\
+        .iterator()
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'built': 0}
+
+
+def get_posting_index():
+    """Return the current PostingIndex, rebuilt or brought up to date."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+
+    with _lock:
+        index = _state['index']
+        if index is None or _state['version'] != version \
+                or time.time() - _state['built'] > settings.POSTINGS_MAX_AGE:
+            index = PostingIndex()
+            index.add_rows(tag_rows())
+            _state.update(index=index, version=version, built=time.time())
+        elif time.time() - index.refreshed >= \
+                settings.POSTINGS_REFRESH_INTERVAL:
+            index.add_rows(tag_rows(
+                after=index.last_row - settings.POSTINGS_REFRESH_OVERLAP))
+    return index
+
+
+def invalidate_postings():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def tagged_question_ids(text):
+    """Return the ids of the public questions matching a tag query, newest
+    first."""
+    return get_posting_index().query(text)
+
+
+class QuestionPage:
+    """
+    A list of question ids for a Paginator, that loads the questions of a
+    page slice with one query.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        ids = self.ids[key]
+        questions = self.queryset.in_bulk(ids)
+        return [questions[i] for i in ids if i in questions]
@@ -0,0 +1,100 @@
+"""
+Profile single requests in production, see middleware.ProfilerMiddleware.
+
+Two modes (settings.PROFILER_MODE):
+
+- "cprofile" traces every function call of the view with cProfile and
+  writes a pstats dump (.prof). Exact, but slows the profiled request down.
+- "sample" looks at the stack of the request thread every
+  PROFILER_SAMPLE_INTERVAL seconds from a background thread and writes the
+  collapsed stacks (.folded, one "outer;...;inner count" line per stack)
+  that flame graph tools read. The profiled request runs at almost full
+  speed.
+
+Dumps are written to PROFILER_DIR/<url name>/ and summed up by the
+profile_report command.
+"""
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+_counter = itertools.count()
+
+
+class StackSampler:
+    """Count the stacks seen in one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(
+                    os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def runcall(self, func):
+        self._thread.start()
+        try:
+            return func()
+        finally:
+            self._stop.set()
+            self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+def dump_path(url_name, extension):
+    directory = os.path.join(settings.PROFILER_DIR, url_name or 'unnamed')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, '{}-{}-{}.{}'.format(
+        time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(_counter),
+        extension))
+
+
+def profile(func, url_name):
+    """Call func under the configured profiler, return its result and the
+    path of the written dump."""
+    if settings.PROFILER_MODE == 'sample':
+        profiler = StackSampler(threading.get_ident(),
+                                settings.PROFILER_SAMPLE_INTERVAL)
+        result = profiler.runcall(func)
+        path = dump_path(url_name, 'folded')
+        profiler.dump(path)
+    else:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func)
+        path = dump_path(url_name, 'prof')
+        profiler.dump_stats(path)
+    return result, path
+
+
+def read_folded(paths):
+    """Sum up the collapsed stacks of several .folded dumps."""
+    stacks = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+    return stacks
@@ -0,0 +1,82 @@
+"""
+Render question and answer text (Markdown, then bleached) to HTML once,
+when it is saved, instead of on every page view. The result is stored in
+models.ContentBody together with RENDERER_VERSION. Increase the version
+whenever the output changes (e.g. different Markdown extras or allowed
+tags), and stale bodies are rendered again when they are next shown.
+
+A body also stores the hash of the text it was rendered from, which is
+compared with Content.text_hash, so the text itself is only loaded to
+render it. Until the job queued by an edit has stored the new body (or if
+it failed), the hashes don't match and the edited text is rendered when it
+is shown.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils.safestring import mark_safe
+from django_bleach.templatetags.bleach_tags import bleach_value
+from markdown_deux import markdown
+
+from pgm4app.models import Content, ContentBody, text_hash
+
+RENDERER_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def render_text(text):
+    """The same as {{ text|markdown|bleach }} in a template."""
+    return bleach_value(markdown(text, 'default'))
+
+
+def make_body(pk, text):
+    """Render the text to an unsaved ContentBody."""
+    return ContentBody(content_id=pk, html=render_text(text),
+                       renderer_version=RENDERER_VERSION,
+                       source_hash=text_hash(text))
+
+
+def save_bodies(bodies):
+    try:
+        with transaction.atomic():
+            ContentBody.objects.filter(pk__in=[b.pk for b in bodies])\
+                .delete()
+            ContentBody.objects.bulk_create(bodies)
+    except IntegrityError:
+        # Usually another request rendered the same text at the same time,
+        # the bodies are rendered again when they are next shown.
+        logger.warning('Could not store the bodies of %s',
+                       [b.pk for b in bodies], exc_info=True)
+
+
+def store_body(content):
+    """Render and store the body of a new or changed Content object."""
+    save_bodies([make_body(content.pk, content.text)])
+
+
+def attach_html(contents):
+    """
+    Set an "html" attribute on every Content object with its rendered text.
+    Loads the stored bodies with one query, and renders and stores the ones
+    that are missing, were rendered by an older RENDERER_VERSION or from a
+    different text. The text only has to be loaded for those, with one more
+    query for the ones where it was deferred.
+    """
+    bodies = ContentBody.objects.in_bulk([c.pk for c in contents])
+    stale = [c for c in contents if c.pk not in bodies
+             or bodies[c.pk].renderer_version != RENDERER_VERSION
+             or not c.text_hash
+             or bodies[c.pk].source_hash != c.text_hash]
+    if stale:
+        deferred = [c.pk for c in stale if 'text' not in c.__dict__]
+        texts = dict(Content.objects.filter(pk__in=deferred)
+                     .values_list('pk', 'text'))
+        new_bodies = [make_body(c.pk, texts.get(c.pk, '') if c.pk in deferred
+                                else c.text)
+                      for c in stale]
+        bodies.update((b.pk, b) for b in new_bodies)
+        save_bodies(new_bodies)
+    for content in contents:
+        content.html = mark_safe(bodies[content.pk].html)
+    return contents
@@ -0,0 +1,109 @@
+"""
+Revision history of edited posts. The current text is Content.text, every
+former text is a models.Revision holding a reverse diff: the line edits
+that turn the text that replaced it back into it, as zlib-compressed JSON.
+A small edit of a long post therefore stores a few bytes, not a copy.
+
+Every REVISIONS_FULL_EVERY revisions (and whenever the diff would not be
+smaller) the full text is stored instead, so rebuilding any revision
+applies at most that many diffs, starting from the nearest newer full text
+or the current text.
+
+Revisions are recorded by the "revisions.record" job, queued when an edit is
+saved (see pgm4app.signals), and ordered by the time the text was replaced,
+so a late job still lands in the right place of the history. The job only
+gets the old text and a checksum of the new one, and diffs against the
+current text. If the post was edited again before it ran, the current text
+is not the one that replaced the old text, and the full text is stored.
+"""
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Q
+
+from pgm4app.models import Revision
+
+
+def text_crc(text):
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def make_diff(base, text):
+    """Return the compressed line edits that turn base into text."""
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j1 < j2:
+            ops.append(''.join(lines[j1:j2]))
+    return zlib.compress(json.dumps(ops).encode('utf-8'), 9)
+
+
+def apply_diff(base, data):
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(data).decode('utf-8')):
+        if isinstance(op, list):
+            parts.extend(base_lines[op[0]:op[1]])
+        else:
+            parts.append(op)
+    return ''.join(parts)
+
+
+def record_revision(content, old_text, new_crc, replaced):
+    """
+    Store old_text as a revision of content, replaced by the text with the
+    checksum new_crc.
+    """
+    full = zlib.compress(old_text.encode('utf-8'), 9)
+    is_full = text_crc(content.text) != new_crc or \
+        (content.revisions.count() + 1) % settings.REVISIONS_FULL_EVERY == 0
+    if not is_full:
+        diff = make_diff(content.text, old_text)
+        is_full = len(full) <= len(diff)
+    return Revision.objects.create(
+        content=content, replaced=replaced, is_full=is_full,
+        data=full if is_full else diff, base_crc=new_crc,
+        size=len(old_text))
+
+
+def _newer(revision):
+    return revision.content.revisions.filter(
+        Q(replaced__gt=revision.replaced) |
+        Q(replaced=revision.replaced, pk__gt=revision.pk))\
+        .order_by('replaced', 'pk')
+
+
+def revision_text(revision):
+    """
+    Return the text of a revision. Raises ValueError if a newer revision
+    it depends on was not recorded yet.
+    """
+    chain = [revision]
+    if not revision.is_full:
+        for newer in _newer(revision).iterator():
+            chain.append(newer)
+            if newer.is_full:
+                break
+
+    if chain[-1].is_full:
+        text = zlib.decompress(bytes(chain.pop().data)).decode('utf-8')
+    else:
+        text = revision.content.text
+    for step in reversed(chain):
+        if text_crc(text) != step.base_crc:
+            raise ValueError('The revision history is incomplete.')
+        text = apply_diff(text, bytes(step.data))
+    return text
+
+
+def revision_texts(revision):
+    """Return the text of the revision and the text that replaced it."""
+    newer = _newer(revision).first()
+    return (revision_text(revision),
+            revision_text(newer) if newer else revision.content.text)
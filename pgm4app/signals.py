@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from pgm4app.feeds import invalidate_feeds
+from pgm4app.jobs import enqueue
+from pgm4app.middleware import user_cache_key
+from pgm4app.models import Content, Tag
+from pgm4app.postings import invalidate_postings
+from pgm4app.revisions import text_crc
+from pgm4app.tagindex import invalidate_tag_index
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """
+    Apply settings.SQLITE_PRAGMAS to every new SQLite connection. With
+    persistent connections (CONN_MAX_AGE) this runs once per worker thread,
+    not once per request.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    cursor = connection.cursor()
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', []):
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_cached_user(sender, instance, **kwargs):
+    """Changed users (e.g. a new password) are reloaded on the next request."""
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(user_logged_out)
+def clear_cached_user_on_logout(sender, request, user, **kwargs):
+    if user is not None:
+        cache.delete(user_cache_key(user.pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def rebuild_tag_index(sender, **kwargs):
+    invalidate_tag_index()
+
+
+@receiver(post_save, sender=Content)
+def update_similarity_index(sender, instance, created, update_fields, **kwargs):
+    """Keep the similar questions index current when a question changes."""
+    if not instance.is_question:
+        return
+    if update_fields and not {'title', 'text'} & set(update_fields):
+        return  # e.g. only a counter changed
+    enqueue('similarity.index', {'question': instance.pk},
+            dedup_key='similarity:{}'.format(instance.pk))
+
+
+@receiver(m2m_changed, sender=Content.tags.through)
+def push_to_followers(sender, instance, action, reverse, pk_set, **kwargs):
+    """Add a question to the feeds of the followers of its new tags."""
+    if action != 'post_add' or reverse or not pk_set:
+        return
+    if instance.is_question and not instance.is_hidden \
+            and not instance.is_deleted:
+        enqueue('timelines.fan_out',
+                {'question': instance.pk, 'tags': sorted(pk_set)})
+
+
+@receiver(post_save, sender=Content)
+def expire_question_feeds(sender, instance, created, update_fields, **kwargs):
+    if not instance.is_question:
+        return
+    if update_fields and not {'title', 'text', 'is_hidden', 'is_deleted'} \
+            & set(update_fields):
+        return
+    slugs = [] if created else instance.tags.values_list('slug', flat=True)
+    invalidate_feeds(slugs)
+
+
+@receiver(m2m_changed, sender=Content.tags.through)
+def expire_tag_feeds(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    tags = instance.tags.all() if action == 'pre_clear' \
+        else Tag.objects.filter(pk__in=pk_set)
+    invalidate_feeds(tags.values_list('slug', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def rebuild_postings_for_tag(sender, created=False, **kwargs):
+    if not created:
+        invalidate_postings()
+
+
+@receiver(post_save, sender=Content)
+def rebuild_postings_for_question(sender, instance, created, update_fields,
+                                  **kwargs):
+    """New tag assignments are picked up incrementally, but a question that
+    is hidden, deleted or shown again changes existing posting lists."""
+    if not instance.is_question:
+        return
+    if update_fields and not {'is_hidden', 'is_deleted'} & set(update_fields):
+        return
+    flags = (instance.is_hidden, instance.is_deleted)
+    if not created and getattr(instance, '_loaded_flags', None) != flags:
+        invalidate_postings()
+    instance._loaded_flags = flags
+
+
+@receiver(m2m_changed, sender=Content.tags.through)
+def rebuild_postings_for_tags(sender, action, **kwargs):
+    if action in ('post_remove', 'post_clear'):
+        invalidate_postings()
+
+
+@receiver(post_save, sender=Content)
+def record_revision(sender, instance, created, update_fields, **kwargs):
+    """Keep the text an edit replaced, see pgm4app.revisions."""
+    old_text = getattr(instance, '_loaded_text', None)
+    if created or old_text is None or old_text == instance.text:
+        return
+    if update_fields and 'text' not in update_fields:
+        return
+    # The diff is made by the worker, never in the request.
+    enqueue('revisions.record',
+            {'content': instance.pk, 'old_text': old_text,
+             'new_crc': text_crc(instance.text),
+             'replaced': (instance.edited or now()).isoformat()},
+            inline=False)
+    instance._loaded_text = instance.text
+
+
+@receiver(post_save, sender=Content)
+def render_body(sender, instance, update_fields, **kwargs):
+    """Render questions and answers when they are saved, not when shown."""
+    if instance.is_comment:
+        return
+    if update_fields and 'text' not in update_fields:
+        return
+    enqueue('rendering.body', {'content': instance.pk},
+            dedup_key='body:{}'.format(instance.pk))
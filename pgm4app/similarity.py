@@ -0,0 +1,178 @@
+"""
+Find similar questions with MinHash signatures and locality sensitive
+hashing (LSH).
+
+Each question is reduced to a set of words and word pairs from its title and
+text, and that set to a MinHash signature of SIMILARITY_NUM_PERM integers.
+Two signatures agree in about as many positions as the two sets overlap
+(Jaccard similarity). The signature is split into bands of
+SIMILARITY_BAND_ROWS values, and each band is hashed into one bucket key.
+Questions sharing at least one bucket are candidates, and candidates are
+ranked by their estimated similarity. A lookup therefore reads a handful of
+index entries instead of comparing against every question.
+
+The related questions of a question page start from the stored signature and
+are cached for SIMILAR_QUESTIONS_CACHE_TIMEOUT seconds. Indexing the question
+again clears its entry.
+"""
+import random
+import re
+import struct
+import zlib
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from pgm4app.models import Content, SimilarityBucket, SimilaritySignature
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by can do does for from how i if in is it my '
+    'of on or so than that the this to was what when where which who why '
+    'will with you your'.split())
+
+word_re = re.compile(r'[a-z0-9]+')
+
+_permutations = {}
+
+
+def _get_permutations(num_perm):
+    if num_perm not in _permutations:
+        rnd = random.Random(4711)  # must be the same in every process
+        _permutations[num_perm] = [(rnd.randint(1, MERSENNE_PRIME - 1),
+                                    rnd.randint(0, MERSENNE_PRIME - 1))
+                                   for _ in range(num_perm)]
+    return _permutations[num_perm]
+
+
+def shingles(title, text=''):
+    """Return the set of words and adjacent word pairs of a question."""
+    words = [w for w in word_re.findall('{} {}'.format(title, text[:2000])
+                                        .lower()) if w not in STOPWORDS]
+    tokens = set(words)
+    tokens.update('{} {}'.format(a, b) for a, b in zip(words, words[1:]))
+    return tokens
+
+
+def minhash(tokens, num_perm=None):
+    """Return the MinHash signature of a set of strings as an array."""
+    num_perm = num_perm or settings.SIMILARITY_NUM_PERM
+    signature = array('I', [MAX_HASH] * num_perm)
+    if not tokens:
+        return signature
+
+    hashes = [zlib.crc32(token.encode('utf-8')) for token in tokens]
+    for i, (a, b) in enumerate(_get_permutations(num_perm)):
+        signature[i] = min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH
+                           for h in hashes)
+    return signature
+
+
+def band_keys(signature, rows=None):
+    """Return one integer bucket key per band of the signature."""
+    rows = rows or settings.SIMILARITY_BAND_ROWS
+    keys = []
+    for band, start in enumerate(range(0, len(signature), rows)):
+        values = signature[start:start + rows]
+        digest = zlib.crc32(struct.pack('{}I'.format(len(values)), *values))
+        keys.append((band << 32) | digest)
+    return keys
+
+
+def estimate_similarity(sig1, sig2):
+    return sum(1 for a, b in zip(sig1, sig2) if a == b) / len(sig1)
+
+
+def question_signature(pk_title_text):
+    """Return (pk, signature bytes) for a (pk, title, text) tuple. Runs in
+    worker processes of the build_similarity_index command."""
+    pk, title, text = pk_title_text
+    return pk, minhash(shingles(title, text)).tobytes()
+
+
+def related_cache_key(question_id):
+    return 'similar:{}'.format(question_id)
+
+
+@transaction.atomic
+def index_question(question):
+    """Add or update a question's signature and LSH buckets."""
+    signature = minhash(shingles(question.title, question.text))
+    SimilaritySignature.objects.update_or_create(
+        question_id=question.pk,
+        defaults={'signature': signature.tobytes()})
+    SimilarityBucket.objects.filter(question_id=question.pk).delete()
+    SimilarityBucket.objects.bulk_create(
+        SimilarityBucket(key=key, question_id=question.pk)
+        for key in band_keys(signature))
+    cache.delete(related_cache_key(question.pk))
+
+
+def _scores(signature, limit, exclude=None):
+    """Return [(question id, score), ...] of the best candidates."""
+    if signature[0] == MAX_HASH:
+        return []  # no usable words
+
+    candidates = Counter(SimilarityBucket.objects
+                         .filter(key__in=band_keys(signature))
+                         .exclude(question_id=exclude)
+                         .values_list('question_id', flat=True))
+    candidates = [pk for pk, _ in candidates.most_common(
+        settings.SIMILARITY_MAX_CANDIDATES)]
+
+    scores = {}
+    for pk, data in SimilaritySignature.objects\
+            .filter(question_id__in=candidates)\
+            .values_list('question_id', 'signature'):
+        score = estimate_similarity(signature, array('I', bytes(data)))
+        if score >= settings.SIMILARITY_MIN_SCORE:
+            scores[pk] = score
+    best = sorted(scores, key=lambda pk: (-scores[pk], -pk))[:limit * 2]
+    return [(pk, scores[pk]) for pk in best]
+
+
+def _load(scores, limit):
+    if not scores:
+        return []
+    scores = dict(scores)
+    questions = Content.objects.public().questions()\
+        .filter(pk__in=list(scores)).headers()
+    questions = sorted(questions, key=lambda q: (-scores[q.pk], -q.pk))
+    for question in questions:
+        question.similarity = scores[question.pk]
+    return questions[:limit]
+
+
+def similar_questions(title, text='', limit=None, exclude=None):
+    """
+    Return up to limit public questions similar to the given title and text,
+    most similar first. Each one gets a "similarity" attribute (0 to 1).
+    """
+    limit = limit or settings.SIMILAR_QUESTIONS_LIMIT
+    signature = minhash(shingles(title, text))
+    return _load(_scores(signature, limit, exclude=exclude), limit)
+
+
+def related_questions(question, limit=None):
+    """
+    Like similar_questions() for an indexed question, but start from its
+    stored signature and cache the ids of the best matches.
+    """
+    limit = limit or settings.SIMILAR_QUESTIONS_LIMIT
+    key = related_cache_key(question.pk)
+    scores = cache.get(key)
+    if scores is None:
+        stored = SimilaritySignature.objects.filter(question_id=question.pk)\
+            .values_list('signature', flat=True).first()
+        if stored is None:
+            signature = minhash(shingles(question.title, question.text))
+        else:
+            signature = array('I', bytes(stored))
+        scores = _scores(signature, limit, exclude=question.pk)
+        cache.set(key, scores, settings.SIMILAR_QUESTIONS_CACHE_TIMEOUT)
+    return _load(scores, limit)
@@ -0,0 +1,171 @@
+"""
+Sitemap files for crawlers, written to settings.SITEMAP_ROOT.
+
+Public questions and tags are split into chunks by fixed primary key ranges
+of settings.SITEMAP_CHUNK_SIZE ids, so a chunk never has more than the 50000
+URLs a sitemap file may list and an item always stays in the same file. A
+manifest remembers a fingerprint (number of items and latest change) of
+every chunk, and only chunks whose fingerprint changed are written again.
+New questions all land in the last chunk, so a regular rebuild usually
+writes a single file plus the sitemap index.
+"""
+import json
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max
+
+from pgm4app.models import Content, Tag
+from pgm4app.utils import iterate_in_chunks
+
+MANIFEST_NAME = 'manifest.json'
+INDEX_NAME = 'sitemap.xml'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def w3c_datetime(value):
+    return value.replace(microsecond=0).isoformat() if value else None
+
+
+def _latest(*values):
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+
+def chunk_name(section, chunk):
+    return '{}-{}.xml'.format(section, chunk)
+
+
+def _with_chunk(queryset):
+    size = settings.SITEMAP_CHUNK_SIZE
+    return queryset.annotate(chunk=ExpressionWrapper(
+        (F('pk') - 1) / size, output_field=IntegerField()))
+
+
+def _chunk_range(queryset, chunk):
+    size = settings.SITEMAP_CHUNK_SIZE
+    return queryset.filter(pk__gt=chunk * size, pk__lte=(chunk + 1) * size)
+
+
+def question_chunks():
+    """Return {chunk: (count, lastmod)} for public questions, one query."""
+    rows = _with_chunk(Content.objects.public().questions())\
+        .values('chunk').order_by('chunk')\
+        .annotate(count=Count('pk'), created=Max('created'),
+                  edited=Max('edited'), answered=Max('last_answered'))
+    return {row['chunk']: (row['count'], _latest(
+        row['created'], row['edited'], row['answered'])) for row in rows}
+
+
+def question_urls(chunk):
+    rows = _chunk_range(Content.objects.public().questions(), chunk)\
+        .values_list('pk', 'slug', 'created', 'edited', 'last_answered')
+    for pk, slug, created, edited, answered in iterate_in_chunks(rows):
+        url = reverse('question-detail', args=[pk, slug])
+        yield url, w3c_datetime(_latest(created, edited, answered))
+
+
+def tag_chunks():
+    """
+    Return {chunk: (count, highest pk)} for tags. Tags have no timestamps,
+    so their chunks have no lastmod and a rename is only picked up by the
+    next forced rebuild.
+    """
+    rows = _with_chunk(Tag.objects.all()).values('chunk').order_by('chunk')\
+        .annotate(count=Count('pk'), last=Max('pk'))
+    return {row['chunk']: (row['count'], row['last']) for row in rows}
+
+
+def tag_urls(chunk):
+    rows = _chunk_range(Tag.objects.all(), chunk).values_list('pk', 'slug')
+    for pk, slug in iterate_in_chunks(rows):
+        yield reverse('tag-detail', args=[slug]), None
+
+
+SECTIONS = (
+    # (name, fingerprints, urls, fingerprint to lastmod)
+    ('questions', question_chunks, question_urls,
+     lambda fp: w3c_datetime(fp[1])),
+    ('tags', tag_chunks, tag_urls, lambda fp: None),
+)
+
+
+def _write(path, lines):
+    """Write lines to a temporary file and move it in place, so crawlers
+    never see a half written sitemap."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(tmp, path)
+
+
+def _entry(tag, loc, lastmod):
+    loc = escape(settings.CANONICAL_BASE + loc)
+    if lastmod:
+        return '<{0}><loc>{1}</loc><lastmod>{2}</lastmod></{0}>\n'\
+            .format(tag, loc, lastmod)
+    return '<{0}><loc>{1}</loc></{0}>\n'.format(tag, loc)
+
+
+def _urlset(urls):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="{}">\n'.format(XMLNS)
+    for loc, lastmod in urls:
+        yield _entry('url', loc, lastmod)
+    yield '</urlset>\n'
+
+
+def _chunk_order(name):
+    section, chunk = name[:-len('.xml')].rsplit('-', 1)
+    return section, int(chunk)
+
+
+def _sitemapindex(files):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="{}">\n'.format(XMLNS)
+    for name in sorted(files, key=_chunk_order):
+        yield _entry('sitemap', reverse('sitemap', args=[name]),
+                     files[name]['lastmod'])
+    yield '</sitemapindex>\n'
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_sitemaps(root=None, force=False):
+    """
+    Write the chunks that changed since the last build, remove the ones
+    that became empty, and write the sitemap index. Return the names of the
+    written chunk files.
+    """
+    root = root or settings.SITEMAP_ROOT
+    os.makedirs(root, exist_ok=True)
+    old = load_manifest(root)
+    manifest, written = {}, []
+
+    for section, fingerprints, urls, lastmod in SECTIONS:
+        for chunk, fingerprint in fingerprints().items():
+            name = chunk_name(section, chunk)
+            manifest[name] = {'fingerprint': [str(v) for v in fingerprint],
+                              'lastmod': lastmod(fingerprint)}
+            if force or old.get(name) != manifest[name] \
+                    or not os.path.isfile(os.path.join(root, name)):
+                _write(os.path.join(root, name), _urlset(urls(chunk)))
+                written.append(name)
+
+    for name in set(old) - set(manifest):
+        try:
+            os.remove(os.path.join(root, name))
+        except FileNotFoundError:
+            pass
+
+    _write(os.path.join(root, INDEX_NAME), _sitemapindex(manifest))
+    _write(os.path.join(root, MANIFEST_NAME), [json.dumps(manifest)])
+    return written
@@ -0,0 +1,136 @@
+$(function(){ 'use strict';
+
+  /**
+   * Don't allow newline chars in "textarea.no-newlines" elements.
+  **/
+
+  var _re = new RegExp('[\n\r]', 'g');
+  $('textarea.no-newlines').on('keyup', function (event) {
+    $(this).val($(this).val().replace(_re, ' '));
+  });
+
+  /**
+   * Intercept clicks on up/downvote and send then via AJAX.
+  **/
+
+  function show_auth_link_popup (target) {
+    var _target = $(target)[0];
+    var _top = _target.offsetTop + 'px';
+    var _left = _target.offsetLeft + 'px';
+    var _pos = { position: 'absolute', top: _top, left: _left };
+    $('#js_auth_link_popup').css(_pos).fadeIn('slow');
+  }
+  $(document).on('click', '.updown a.login', function (event) {
+    event.preventDefault();
+    show_auth_link_popup(event.target);
+  });
+  $(document).on('submit', '.updown form', function (event) {
+    event.preventDefault();
+
+    var $this = $(this);
+    var $otherForm = $this.siblings('form');
+    var $points = $this.siblings('.points');
+    var url = $this.prop('action');
+
+    $.post(url, $.param($(this).serializeArray())).then(
+      function(data, textStatus, jqXHR){
+        var wasActive = $this.hasClass('active');
+        var otherWasActive = $otherForm.hasClass('active');
+        var points = parseInt($points.text());
+
+        $this.removeClass('active');
+        $otherForm.removeClass('active');
+
+        if ($this.hasClass('up')) {
+          if (wasActive) {
+            points -= 1;
+          } else {
+            $this.addClass('active');
+            if (otherWasActive) { points += 2; } else { points += 1; }
+          }
+        } else if ($this.hasClass('down')) {
+          if (wasActive) {
+            points += 1;
+          } else {
+            $this.addClass('active');
+            if (otherWasActive) { points -= 2; } else { points -= 1; }
+          }
+        }
+        $points.text(points);
+      },
+      function (jqXHR, textStatus) {
+        if (jqXHR.status == 401) return show_auth_link_popup(event.target);
+      });
+  });
+
+  /**
+   * Replace "show more answers/comments" links with the next page.
+  **/
+
+  $(document).on('click', 'a.more', function (event) {
+    event.preventDefault();
+    var $this = $(this);
+    $.get($this.prop('href')).then(function (html) {
+      $this.replaceWith(html);
+    });
+  });
+
+  /**
+   * Suggest tags while typing into the tags input of the ask form.
+  **/
+
+  $('input[data-autocomplete-url]').each(function () {
+    var $input = $(this);
+    var $list = $('<ul class="tag-suggestions"></ul>').insertAfter($input);
+    var timer = null;
+
+    function words () { return $input.val().split(/[\s,]+/); }
+
+    $input.on('keyup', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var q = words().pop();
+        if (!q) return $list.empty();
+        $.getJSON($input.data('autocomplete-url'), { q: q }).then(function (data) {
+          $list.empty();
+          $.each(data.tags, function (i, tag) {
+            $('<li></li>').text(tag.name).attr('data-slug', tag.slug).appendTo($list);
+          });
+        });
+      }, 150);
+    });
+
+    $list.on('click', 'li', function () {
+      var list = words();
+      list[list.length - 1] = $(this).data('slug');
+      $input.val(list.join(' ') + ' ').focus();
+      $list.empty();
+    });
+  });
+
+  /**
+   * Show possible duplicates while a new question's title is typed.
+  **/
+
+  $('textarea[data-similar-url]').each(function () {
+    var $input = $(this);
+    var $list = $('<ul class="similar-questions"></ul>').insertAfter($input);
+    var timer = null;
+
+    $input.on('keyup', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var title = $input.val();
+        if (title.length < 10) return $list.empty();
+        $.getJSON($input.data('similar-url'), { title: title }).then(function (data) {
+          $list.empty();
+          $.each(data.questions, function (i, question) {
+            var $a = $('<a target="_blank"></a>').attr('href', question.url).text(question.title);
+            $('<li></li>').append($a).appendTo($list);
+          });
+        });
+      }, 300);
+    });
+  });
+
+});
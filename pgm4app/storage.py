@@ -0,0 +1,61 @@
+import gzip
+import io
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip alone is fine
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage (content hashed file names) that also writes gzip and,
+    if the brotli module is installed, brotli compressed copies of every
+    hashed text file during collectstatic. The copies are stored next to the
+    original as "name.gz" and "name.br" and are served by StaticFileView.
+    """
+    compress_extensions = ('.css', '.js', '.svg', '.txt', '.json', '.xml',
+                           '.html', '.map', '.ico')
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super().post_process(paths, dry_run=dry_run, **options)
+        for post_processed in processed:
+            yield post_processed
+
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if os.path.splitext(name)[1].lower() in self.compress_extensions:
+                self.compress(name)
+
+    def compress(self, name):
+        """Write compressed copies of a file, if they are smaller."""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        buf = io.BytesIO()
+        # A fixed mtime keeps the output identical between deploys.
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9,
+                           mtime=0) as f:
+            f.write(data)
+        variants = [('.gz', buf.getvalue())]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+
+        for ext, compressed in variants:
+            if len(compressed) < len(data):
+                with open(path + ext, 'wb') as f:
+                    f.write(compressed)
+
+    def stored_name(self, name):
+        # Before collectstatic has run (development, tests) there is no
+        # manifest and no file in STATIC_ROOT to hash, use the plain name.
+        # Once there is a manifest, a missing file raises ValueError, as in
+        # ManifestStaticFilesStorage.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
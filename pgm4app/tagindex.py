@@ -0,0 +1,74 @@
+"""
+In-process index of all tags for the tag autocomplete. Tags are kept in a
+list sorted by slug, so all tags starting with a prefix are one bisect away,
+and the matches are ranked by popularity (number of tagged questions).
+
+Every process keeps its own copy. Adding, renaming or deleting a tag bumps a
+version number in the cache (see pgm4app.signals), which makes all processes
+rebuild on their next lookup. Popularity counts are refreshed at least every
+TAG_INDEX_MAX_AGE seconds.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils.text import slugify
+
+from pgm4app.models import Tag
+
+VERSION_KEY = 'tagindex:version'
+
+
+class TagIndex:
+
+    def __init__(self, tags):
+        """
+        :param tags: iterable of (slug, name, popularity) tuples.
+        """
+        self.entries = sorted(tags)
+        self.slugs = [entry[0] for entry in self.entries]
+
+    def search(self, prefix, limit=10):
+        """Return up to limit (slug, name, popularity) tuples, most popular
+        first, whose slug starts with prefix."""
+        start = bisect.bisect_left(self.slugs, prefix)
+        end = bisect.bisect_left(self.slugs, prefix + '\uffff', lo=start)
+        return heapq.nlargest(limit, self.entries[start:end],
+                              key=lambda entry: (entry[2], entry[0]))
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'built': 0}
+
+
+def get_tag_index():
+    """Return the current TagIndex, rebuilding it if it is outdated."""
+    version = cache.get(VERSION_KEY, 0)
+    if _state['index'] is None or _state['version'] != version \
+            or time.time() - _state['built'] > settings.TAG_INDEX_MAX_AGE:
+        with _lock:
+            rows = Tag.objects.annotate(popularity=Count('content'))\
+                .values_list('slug', 'name', 'popularity')
+            _state['index'] = TagIndex(rows)
+            _state['version'] = version
+            _state['built'] = time.time()
+    return _state['index']
+
+
+def invalidate_tag_index():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def autocomplete(query, limit=10):
+    """Return tag matches for what the user typed so far."""
+    prefix = slugify(query)
+    if not prefix:
+        return []
+    return get_tag_index().search(prefix, limit)
@@ -0,0 +1,79 @@
+"""
+Job handlers for pgm4app.jobs. Payloads carry primary keys, and handlers
+load the current state of the objects when they run. A handler for an
+object that was deleted in the meantime does nothing.
+"""
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from pgm4app import dashboard
+from pgm4app.jobs import register
+from pgm4app.models import Content
+from pgm4app.rendering import store_body
+from pgm4app.revisions import record_revision
+from pgm4app.similarity import index_question
+from pgm4app.timelines import fan_out
+from pgm4app.trending import record_event
+from pgm4app.viewcounts import merge_payload
+
+
+def trending_event(question_id, weight):
+    return {'question': question_id, 'weight': weight,
+            'timestamp': time.time()}
+
+
+@register('trending.record', batch=True)
+def record_trending_events(payloads):
+    """
+    Sum up the weights per question and per shortest ring bucket, so that a
+    burst of votes on one question is a single counter update.
+    """
+    seconds = min(s for s, _ in settings.TRENDING_RINGS.values())
+    weights = Counter()
+    for p in payloads:
+        weights[p['question'], int(p['timestamp']) // seconds] += p['weight']
+    for (question_id, bucket), weight in sorted(weights.items()):
+        record_event(Content(pk=question_id), weight=weight,
+                     timestamp=bucket * seconds)
+
+
+@register('similarity.index')
+def index_similar_question(payload):
+    question = Content.objects.filter(pk=payload['question']).first()
+    if question is not None:
+        index_question(question)
+
+
+@register('rendering.body')
+def render_body(payload):
+    content = Content.objects.filter(pk=payload['content']).first()
+    if content is not None:
+        store_body(content)
+
+
+@register('revisions.record')
+def record_edit(payload):
+    content = Content.objects.filter(pk=payload['content']).first()
+    if content is not None:
+        record_revision(content, payload['old_text'], payload['new_crc'],
+                        parse_datetime(payload['replaced']))
+
+
+@register('views.merge')
+def merge_view_sketches(payload):
+    merge_payload(payload)
+
+
+@register('timelines.fan_out')
+def push_to_followers(payload):
+    question = Content.objects.filter(pk=payload['question']).first()
+    if question is not None:
+        fan_out(question, payload['tags'])
+
+
+@register('dashboard.refresh')
+def refresh_dashboard(payload):
+    dashboard.refresh()
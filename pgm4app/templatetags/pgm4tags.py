@@ -1,6 +1,6 @@
 from django.template.defaultfilters import register
 
-from pgm4app.models import Vote
+from pgm4app.models import Content, LastSeen
 
 
 @register.filter(name='complete_content_list_for_user')
@@ -13,12 +13,47 @@ def complete_content_list_for_user(content_list, user):
     if user.is_anonymous():
         return content_list
 
-    content_list = list(content_list)
-    content_id_list = [x.id for x in content_list]
-    votes_qs = Vote.objects.filter(user=user, content_id__in=content_id_list)
-    votes = {obj.content_id: obj.value for obj in votes_qs}
-    for obj in content_list:
-        obj.is_upvoted = votes.get(obj.id, 0) == 1
-        obj.is_downvoted = votes.get(obj.id, 0) == -1
+    return Content.attach_user_votes(content_list, user)
 
-    return content_list
+
+@register.filter(name='mark_unread_for_user')
+def mark_unread_for_user(question_list, user):
+    """
+    :param question_list: A list or queryset of questions.
+    :param user: The user who's last visits we compare with.
+    :return: List of questions with a "has_unread" property added.
+    """
+    if user.is_anonymous():
+        return question_list
+
+    return LastSeen.objects.annotate_unread(user, question_list)
+
+
+# The inclusion tags below render the items of a thread page. They expect the
+# thread to be preloaded by pgm4app.threads.load_thread() and don't run any
+# queries themselves.
+
+@register.inclusion_tag('pgm4app/updown_partial.html', takes_context=True)
+def updown(context, obj):
+    """
+    Render the up/down vote buttons for a Content object. Anonymous users
+    get login links instead of forms, so that their pages carry no CSRF
+    token and can be compressed (see CompressionMiddleware).
+    """
+    return {'obj': obj, 'user': context.get('user')}
+
+
+@register.inclusion_tag('pgm4app/answer_detail_partial.html',
+                        takes_context=True)
+def answer_item(context, answer):
+    """Render one answer, with its preloaded "comment_list"."""
+    return {'answer': answer, 'question': context['object'],
+            'user': context['user']}
+
+
+@register.inclusion_tag('pgm4app/comment_list_partial.html',
+                        takes_context=True)
+def comment_list(context, parent):
+    """Render the preloaded "comment_list" of a question or answer."""
+    return {'comments': parent.comment_list, 'parent': parent,
+            'user': context['user']}
@@ -1,9 +1,42 @@
+import gzip
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib import auth
 from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, RequestFactory, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils.text import slugify
+from django.utils.timezone import now
 
-from pgm4app.models import Content, Tag
+from pgm4app import dashboard, jobs, postings, viewcounts
+from pgm4app.checks import check_shared_cache
+from pgm4app.hll import HyperLogLog
+from pgm4app.middleware import choose_encoding, user_cache_key
+from pgm4app.rendering import RENDERER_VERSION, attach_html
+from pgm4app.sitemaps import build_sitemaps
+from pgm4app.models import Content, ContentBody, FeedEntry, Job, \
+    LastSeen, Revision, Tag, TrendCounter, SimilarityBucket, ViewSketch
+from pgm4app.postings import PostingIndex, tag_rows, tagged_question_ids
+from pgm4app.revisions import revision_texts
+from pgm4app.similarity import related_questions
+from pgm4app.timelines import follow, get_feed, unfollow
+from pgm4app.tasks import record_trending_events
+from pgm4app.trending import current_bucket, record_event, top
+from pgm4app.utils import iterate_in_chunks
+from pgm4app.views import StaticFileView
+from pgm4app.viewcounts import unique_viewers
+from pgm4app.warmup import ImportTimer, warm_up
 
 
 class Pgm4appTestCase(TestCase):
@@ -166,3 +199,1071 @@ class Pgm4appTestCase(TestCase):
         # Verify that question and decendents are not displayed anymore
         # TODO
 
+
+class DatabaseProfileTestCase(TestCase):
+
+    def test_sqlite_pragmas_applied(self):
+        """New SQLite connections get the busy timeout and sync pragmas."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], 20000)
+        cursor.execute('PRAGMA synchronous')
+        self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_iterate_in_chunks(self):
+        """All rows are returned in pk order, one query per chunk."""
+        for i in range(7):
+            Tag.objects.create(name='tag{}'.format(i))
+        expected = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+        with self.assertNumQueries(4):
+            found = [t.pk for t in iterate_in_chunks(Tag.objects.all(), 2)]
+        self.assertEqual(found, expected)
+
+        qs = Tag.objects.values_list('pk', 'name')
+        self.assertEqual([r[0] for r in iterate_in_chunks(qs, 3)], expected)
+
+
+class ThreadRenderTestCase(TestCase):
+    user1 = Pgm4appTestCase.user1
+    user2 = Pgm4appTestCase.user2
+
+    def setUp(self):
+        User.objects.create_user(**self.user1)
+        User.objects.create_user(**self.user2)
+
+    def _get_query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    @override_settings(THREAD_COMMENTS_PAGE_SIZE=10)
+    def test_thread_queries_independent_of_size(self):
+        """
+        The detail page runs the same number of queries for a thread with one
+        answer as for a thread with many answers and comments.
+        """
+        user = User.objects.get(username=self.user2['username'])
+        q = Content.objects.create(content_type='q', title='Q', user=user)
+        a = Content.objects.create(content_type='a', parent=q, user=user)
+        Content.objects.create(content_type='c', parent=a, user=user)
+        url = reverse('question-detail', args=[q.pk, q.slug])
+
+        self.client.login(**self.user1)
+        self.client.get(url)  # warm the session and user cache
+        small = self._get_query_count(url)
+
+        for i in range(5):
+            a = Content.objects.create(content_type='a', parent=q, user=user,
+                                       text='answer {}'.format(i))
+            Content.objects.create(content_type='c', parent=a, user=user,
+                                   text='comment {}'.format(i))
+            Content.objects.create(content_type='c', parent=q, user=user)
+
+        self.client.get(url)  # mark the new answers seen
+        self.assertEqual(self._get_query_count(url), small)
+        response = self.client.get(url)
+        self.assertContains(response, 'answer 4')
+        self.assertContains(response, 'comment 4')
+
+    @override_settings(THREAD_ANSWERS_PAGE_SIZE=2,
+                       THREAD_COMMENTS_PAGE_SIZE=2)
+    def test_answers_and_comments_are_paginated(self):
+        """
+        The detail page shows the accepted answer and the first page of
+        answers and comments, the cursor links load the rest.
+        """
+        user = User.objects.get(username=self.user2['username'])
+        q = Content.objects.create(content_type='q', title='Q', user=user)
+        answers = [Content.objects.create(
+            content_type='a', parent=q, user=user, text='answer {}'.format(i))
+            for i in range(5)]
+        for i in range(5):
+            Content.objects.create(content_type='c', parent=q, user=user,
+                                   text='comment {}'.format(i))
+        answers[0].accept()
+        q.refresh_from_db()
+
+        response = self.client.get(reverse('question-detail',
+                                           args=[q.pk, q.slug]))
+        self.assertEqual([a.pk for a in response.context['answers']],
+                         [answers[0].pk, answers[4].pk, answers[3].pk])
+        self.assertNotContains(response, 'answer 2')
+        self.assertContains(response, 'comment 1')
+        self.assertNotContains(response, 'comment 2')
+
+        url = reverse('answer-page', args=[q.pk])
+        after = response.context['object'].answers_cursor
+        response = self.client.get(url, {'after': after})
+        self.assertEqual([a.pk for a in response.context['answers']],
+                         [answers[2].pk, answers[1].pk])
+        self.assertIsNone(response.context['object'].answers_cursor)
+
+        comments = list(Content.objects.comments().filter(parent=q))
+        url = reverse('comment-page', args=[q.pk])
+        response = self.client.get(url, {'after': comments[1].pk})
+        self.assertEqual([c.pk for c in response.context['comments']],
+                         [c.pk for c in comments[2:4]])
+        self.assertContains(response, 'more-comments')
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code,
+                         404)
+
+
+class ParentCounterTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.question = Content.objects.create(
+            content_type='q', title='Q', text='original', user=self.user)
+
+    def test_no_lost_updates_on_parent(self):
+        """
+        Answering through a stale copy of the question keeps votes, views
+        and edits that other requests wrote in the meantime.
+        """
+        stale = Content.objects.get(pk=self.question.pk)
+        Content.objects.filter(pk=stale.pk).update(
+            points=5, count_views=7, text='edited')
+        answer = Content.objects.create(content_type='a', parent=stale,
+                                        user=self.user)
+        Content.objects.create(content_type='c', parent=stale,
+                               user=self.user)
+
+        q = Content.objects.get(pk=stale.pk)
+        self.assertEqual((q.points, q.count_views, q.text),
+                         (5, 7, 'edited'))
+        self.assertEqual((q.count_answers, q.count_comments), (1, 1))
+        self.assertIsNotNone(q.last_answered)
+        self.assertEqual(q.answers().get(), answer)
+
+    def test_bulk_children_update_parent_once(self):
+        children = [Content(content_type='c', parent=self.question,
+                            user=self.user, text=str(i)) for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            Content.objects.bulk_create_children(children)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.count_comments, 20)
+        self.assertIsNone(self.question.last_answered)
+
+
+class RevisionTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(**Pgm4appTestCase.user1)
+        self.client.login(**Pgm4appTestCase.user1)
+        self.question = Content.objects.create(
+            content_type='q', title='Q', user=User.objects.get(),
+            text='\n'.join('line {}'.format(i) for i in range(200)))
+
+    def _edit(self, text, run_jobs=True):
+        q = Content.objects.get(pk=self.question.pk)
+        q.text = text
+        q.edited = now()
+        q.save()
+        if run_jobs:
+            jobs.run_pending()
+
+    @override_settings(REVISIONS_FULL_EVERY=3)
+    def test_rebuild_every_revision(self):
+        texts = [self.question.text]
+        for i in range(7):
+            texts.append(texts[-1].replace('line {}\n'.format(i * 10),
+                                           'edit {}\n'.format(i)))
+            self._edit(texts[-1])
+
+        revisions = list(Revision.objects.order_by('replaced', 'pk'))
+        self.assertEqual(len(revisions), 7)
+        self.assertEqual([r.is_full for r in revisions],
+                         [False, False, True] * 2 + [False])
+        self.assertLess(len(revisions[0].data), 100)
+        for i, revision in enumerate(revisions):
+            self.assertEqual(revision_texts(revision),
+                             (texts[i], texts[i + 1]))
+
+    def test_late_jobs(self):
+        """Edits made before the worker ran are still rebuilt exactly."""
+        texts = [self.question.text]
+        for i in range(3):
+            texts.append(texts[-1].replace('line {}\n'.format(i),
+                                           'late {}\n'.format(i)))
+            self._edit(texts[-1], run_jobs=False)
+        self.assertFalse(Revision.objects.exists())
+
+        jobs.run_pending()
+        revisions = list(Revision.objects.order_by('replaced', 'pk'))
+        self.assertEqual([r.is_full for r in revisions], [True, True, False])
+        for i, revision in enumerate(revisions):
+            self.assertEqual(revision_texts(revision),
+                             (texts[i], texts[i + 1]))
+
+    def test_diff_view(self):
+        self._edit(self.question.text.replace('line 5\n', 'changed\n'))
+        revision = Revision.objects.get()
+        url = reverse('content-revisions', args=[self.question.pk])
+        response = self.client.get(url, {'diff': revision.pk})
+        self.assertContains(response, '<span class="removed">-line 5</span>',
+                            html=True)
+        self.assertContains(response, '<span class="added">+changed</span>',
+                            html=True)
+
+        Revision.objects.update(base_crc=0)
+        response = self.client.get(url, {'diff': revision.pk})
+        self.assertTrue(response.context['incomplete'])
+
+
+class WarmupTestCase(SimpleTestCase):
+
+    def test_warm_up(self):
+        self.assertEqual(list(warm_up()), ['urls', 'templates', 'markdown'])
+
+    def test_import_timer(self):
+        sys.modules.pop('colorsys', None)
+        with ImportTimer() as timer:
+            import colorsys  # noqa
+        self.assertEqual([name for name, _ in timer.slowest()], ['colorsys'])
+
+
+class ViewCountTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(**Pgm4appTestCase.user1)
+        User.objects.create_user(**Pgm4appTestCase.user2)
+        self.question = Content.objects.create(
+            content_type='q', title='Q', user=self.author)
+        self.url = reverse('question-detail',
+                           args=[self.question.pk, self.question.slug])
+        # Views of other tests' questions may still be pending.
+        viewcounts._state['sketches'] = {}
+
+    def test_hyperloglog_estimate_and_merge(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(20000):
+            (a if i % 2 else b).add('visitor {}'.format(i))
+            a.add('visitor {}'.format(i // 4))
+        self.assertAlmostEqual(a.count(), 12500, delta=12500 * 0.05)
+        a.update(b)
+        a.update(b)
+        self.assertAlmostEqual(a.count(), 20000, delta=20000 * 0.05)
+        copy = HyperLogLog.from_bytes(a.to_bytes())
+        self.assertEqual(copy.count(), a.count())
+        self.assertLess(len(HyperLogLog().to_bytes()), 100)
+
+    @override_settings(VIEW_FLUSH_INTERVAL=0)
+    def test_unique_views(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.client.get(self.url, HTTP_USER_AGENT='Googlebot/2.1')
+        self.client.login(**Pgm4appTestCase.user2)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.client.login(**Pgm4appTestCase.user1)  # the author
+        self.client.get(self.url)
+
+        # Merges are always left to the worker.
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.count_views, 0)
+        jobs.run_pending()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.count_views, 2)
+        today = now().date()
+        self.assertEqual(ViewSketch.objects.get(day=today).estimate, 2)
+        self.assertEqual(
+            unique_viewers(self.question, today, today), 2)
+
+
+class StaticFilesTestCase(TestCase):
+
+    def test_collect_and_serve_compressed(self):
+        """
+        collectstatic writes hashed and gzipped files, and the static view
+        serves the gzip copy with a far-future immutable cache header.
+        """
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(STATIC_ROOT=root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+            url = staticfiles_storage.url('pgm4app/pgm4.css')
+            path = url[len('/static/'):]
+            self.assertNotEqual(path, 'pgm4app/pgm4.css')
+            self.assertTrue(os.path.isfile(os.path.join(root, path + '.gz')))
+
+            request = RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip')
+            response = StaticFileView.as_view()(request, path=path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response.close()
+
+            request = RequestFactory().get(
+                url, HTTP_ACCEPT_ENCODING='deflate, gzip;q=0')
+            response = StaticFileView.as_view()(request, path=path)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            response.close()
+
+            with self.assertRaises(ValueError):
+                staticfiles_storage.url('pgm4app/missing.css')
+
+
+class CompressionTestCase(TestCase):
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('deflate, gzip;q=0'), None)
+        self.assertEqual(choose_encoding(''), None)
+
+    def test_html_page_is_gzipped(self):
+        user = User.objects.create_user(username='user1', password='x')
+        q = Content.objects.create(content_type='q', title='Compress me',
+                                   text='Some text. ' * 200, user=user)
+        url = reverse('tag-list')
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        for i in range(2):  # the second response comes from the cache
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            html = gzip.decompress(response.content).decode('utf-8')
+            self.assertIn('</html>', html)
+
+        # Anonymous users get login links instead of vote forms.
+        url = reverse('question-detail', args=[q.pk, q.slug])
+        Content.objects.create(content_type='a', parent=q, user=user,
+                               text='An answer.')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        html = gzip.decompress(response.content).decode('utf-8')
+        self.assertIn('class="up login"', html)
+        self.assertNotIn('csrfmiddlewaretoken', html)
+
+        # The vote forms hold the CSRF token, see BREACH.
+        self.client.login(username='user1', password='x')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTH_USER_CACHE_TIMEOUT=600)
+class CachedAuthTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(**Pgm4appTestCase.user1)
+
+    def test_reads_cost_no_auth_queries(self):
+        """Anonymous and repeated logged in page views run no queries."""
+        url = reverse('home')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        self.client.login(**Pgm4appTestCase.user1)
+        self.client.get(url)  # warms the session and user cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, Pgm4appTestCase.user1['username'])
+
+    def test_password_change_logs_out(self):
+        url = reverse('home')
+        self.client.login(**Pgm4appTestCase.user1)
+        self.client.get(url)
+
+        user = User.objects.get(username=Pgm4appTestCase.user1['username'])
+        user.set_password('something else')
+        user.save()
+
+        response = self.client.get(url)
+        self.assertContains(response, reverse('account_login'))
+
+    def test_local_cache_is_not_used_for_auth(self):
+        """Without a shared cache every request checks the database."""
+        self.client.login(**Pgm4appTestCase.user1)
+        with override_settings(AUTH_USER_CACHE_TIMEOUT=0):
+            self.client.get(reverse('home'))
+            self.assertIsNone(cache.get(user_cache_key(
+                self.client.session[auth.SESSION_KEY])))
+        self.assertEqual(
+            [e.id for e in check_shared_cache(None)], ['pgm4app.W001'])
+
+
+class TrendingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user1', password='x')
+        self.tag = Tag.objects.create(name='python')
+        self.q1 = Content.objects.create(content_type='q', title='One',
+                                         user=self.user)
+        self.q2 = Content.objects.create(content_type='q', title='Two',
+                                         user=self.user)
+        self.q2.tags.add(self.tag)
+
+    def test_votes_and_answers_drive_trending(self):
+        self.q1.toggle_vote(self.user, 1)
+        Content.objects.create(content_type='a', parent=self.q2,
+                               user=self.user)
+
+        self.assertEqual([pk for pk, _ in top('q', 10)],
+                         [self.q2.pk, self.q1.pk])
+        self.assertEqual([pk for pk, _ in top('t', 10)], [self.tag.pk])
+
+        response = self.client.get(reverse('question-list') + '?order=trending')
+        self.assertEqual([q.pk for q in response.context['object_list']],
+                         [self.q2.pk, self.q1.pk])
+
+    def test_old_buckets_are_overwritten(self):
+        """A ring slot is reused once its bucket left the window."""
+        seconds, slots = settings.TRENDING_RINGS['h']
+        bucket = current_bucket(seconds)
+        TrendCounter.objects.create(kind='q', object_id=self.q1.pk,
+                                    resolution='h', slot=bucket % slots,
+                                    bucket=bucket - slots, count=5)
+        record_event(self.q1, weight=2)
+
+        counters = TrendCounter.objects.filter(kind='q', resolution='h',
+                                               object_id=self.q1.pk)
+        self.assertEqual([(c.slot, c.count) for c in counters],
+                         [(bucket % slots, 2)])
+
+    def test_late_events_are_dropped(self):
+        """A late job never rewinds a slot to an older bucket."""
+        seconds, slots = settings.TRENDING_RINGS['m']
+        record_event(self.q1, weight=5)
+        record_trending_events([{'question': self.q1.pk, 'weight': 1,
+                                 'timestamp': time.time() - seconds * slots}])
+
+        counter = TrendCounter.objects.get(kind='q', resolution='m',
+                                           object_id=self.q1.pk)
+        self.assertEqual((counter.bucket, counter.count),
+                         (current_bucket(seconds), 5))
+
+
+class TagAutocompleteTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(**Pgm4appTestCase.user1)
+        self.client.login(**Pgm4appTestCase.user1)
+        for name in ['python', 'pyramid', 'perl', 'django']:
+            Tag.objects.create(name=name)
+        q = Content.objects.create(content_type='q', title='Q')
+        q.tags.add(Tag.objects.get(slug='pyramid'))
+
+    def test_prefix_matches_by_popularity(self):
+        response = self.client.get(reverse('tag-autocomplete'), {'q': 'Py'})
+        slugs = [t['slug'] for t in response.json()['tags']]
+        self.assertEqual(slugs, ['pyramid', 'python'])
+
+        Tag.objects.create(name='pytest')
+        response = self.client.get(reverse('tag-autocomplete'), {'q': 'pyt'})
+        slugs = [t['slug'] for t in response.json()['tags']]
+        self.assertEqual(slugs, ['python', 'pytest'])
+
+    def test_ask_form_takes_tag_slugs(self):
+        response = self.client.get(reverse('question-create'))
+        self.assertNotContains(response, 'perl')
+
+        data = {'title': 'Tagged?', 'tags': 'python django'}
+        response = self.client.post(reverse('question-create'), data=data)
+        self.assertEqual(response.status_code, 302)
+        q = Content.objects.get(title='Tagged?')
+        self.assertEqual(sorted(t.slug for t in q.tags.all()),
+                         ['django', 'python'])
+
+        data = {'title': 'Tagged?', 'tags': 'python nosuchtag'}
+        response = self.client.post(reverse('question-create'), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'nosuchtag')
+
+        response = self.client.get(reverse('question-update', args=[q.pk]))
+        self.assertContains(response, 'value="django python"')
+
+
+@override_settings(POSTINGS_REFRESH_INTERVAL=0)
+class TagQueryTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        tags = {name: Tag.objects.create(name=name)
+                for name in ['python', 'django', 'beginner', 'perl']}
+        self.questions = {}
+        for title, slugs in [('q1', 'python django'),
+                             ('q2', 'python django beginner'),
+                             ('q3', 'python'), ('q4', 'perl')]:
+            q = Content.objects.create(content_type='q', title=title)
+            q.tags.add(*[tags[slug] for slug in slugs.split()])
+            self.questions[title] = q.pk
+
+    def _titles(self, query):
+        return [Content.objects.get(pk=pk).title
+                for pk in tagged_question_ids(query)]
+
+    def test_query_operators(self):
+        self.assertEqual(self._titles('python AND django NOT beginner'),
+                         ['q1'])
+        self.assertEqual(self._titles('python django'), ['q2', 'q1'])
+        self.assertEqual(self._titles('perl OR django -beginner'),
+                         ['q4', 'q1'])
+        self.assertEqual(self._titles('NOT python'), ['q4'])
+        self.assertEqual(self._titles('nosuchtag OR AND'), [])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self._titles('perl'), ['q4'])
+        q5 = Content.objects.create(content_type='q', title='q5')
+        q5.tags.add(Tag.objects.get(slug='perl'))
+        self.assertEqual(self._titles('perl'), ['q5', 'q4'])
+
+        q5.is_hidden = True
+        q5.save()
+        self.assertEqual(self._titles('perl'), ['q4'])
+        Content.objects.get(pk=self.questions['q4']).tags.clear()
+        self.assertEqual(self._titles('perl'), [])
+
+    def test_refresh_reads_late_rows(self):
+        """A row with a lower id that commits later is still picked up."""
+        rows = list(tag_rows())
+        late_id, slug, question_id = rows[0]
+        index = PostingIndex()
+        index.add_rows(rows[1:])  # the first row wasn't committed yet
+        self.assertNotIn(question_id, index.query(slug))
+        index.add_rows(tag_rows(
+            after=index.last_row - settings.POSTINGS_REFRESH_OVERLAP))
+        self.assertIn(question_id, index.query(slug))
+
+    def test_edit_keeps_index(self):
+        tagged_question_ids('python')
+        version = cache.get(postings.VERSION_KEY)
+        q = Content.objects.get(pk=self.questions['q1'])
+        q.text = 'Edited.'
+        q.save()
+        self.assertEqual(cache.get(postings.VERSION_KEY), version)
+        q.is_deleted = True
+        q.save()
+        self.assertNotEqual(cache.get(postings.VERSION_KEY), version)
+
+    def test_question_list(self):
+        self.assertEqual(Content.objects.tagged('django').count(), 2)
+        response = self.client.get(reverse('question-list'),
+                                   {'tags': 'python NOT django'})
+        self.assertEqual([q.title for q in response.context['object_list']],
+                         ['q3'])
+        self.assertEqual(response.context['tag_query'], 'python NOT django')
+
+
+class DashboardTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(**Pgm4appTestCase.user1)
+        tag = Tag.objects.create(name='python')
+        q = Content.objects.create(content_type='q', title='Hot one',
+                                   user=user, points=3, timepoints=10)
+        q.tags.add(tag)
+        Content.objects.create(content_type='q', title='Lonely', user=user)
+
+    def test_home_renders_snapshot_without_queries(self):
+        dashboard.refresh()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Hot one')
+        self.assertContains(response, 'Lonely')
+        sections = response.context['sections']
+        self.assertEqual(sections['tags'][0]['slug'], 'python')
+        self.assertEqual(sections['users'][0]['points'], 3)
+
+    def test_stale_snapshot_is_refreshed_once(self):
+        dashboard.refresh()
+        Content.objects.create(content_type='q', title='Brand new')
+        with override_settings(DASHBOARD_MAX_AGE=-1):
+            cache.add(dashboard.LOCK_KEY, 1)
+            response = self.client.get(reverse('home'))
+            self.assertNotContains(response, 'Brand new')
+
+            cache.delete(dashboard.LOCK_KEY)
+            self.client.get(reverse('home'))  # refreshes inline
+            response = self.client.get(reverse('home'))
+            self.assertContains(response, 'Brand new')
+
+    @override_settings(JOBS_RUN_INLINE=False, DASHBOARD_MAX_AGE=-1)
+    def test_stale_snapshot_is_queued_for_the_worker(self):
+        dashboard.refresh()
+        Content.objects.create(content_type='q', title='Brand new')
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'Brand new')
+        self.assertEqual(Job.objects.filter(
+            name='dashboard.refresh').count(), 1)
+
+        jobs.run_pending()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Brand new')
+
+    def test_missing_snapshot_is_built_once(self):
+        cache.add(dashboard.LOCK_KEY, 1)  # another request is building it
+        response = self.client.get(reverse('home'))
+        self.assertIsNone(response.context['sections'])
+
+        cache.delete(dashboard.LOCK_KEY)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Hot one')
+
+
+class SimilarQuestionsTestCase(TestCase):
+
+    def setUp(self):
+        titles = ['How do I sort a list of dictionaries by a value in Python?',
+                  'Sort a Python list of dictionaries by dictionary value',
+                  'What is the best pizza topping?']
+        cache.clear()
+        self.questions = [Content.objects.create(content_type='q', title=t)
+                          for t in titles]
+
+    def test_similar_questions(self):
+        q1, q2, q3 = self.questions
+        url = reverse('question-detail', args=[q1.pk, q1.slug])
+        response = self.client.get(url)
+        self.assertEqual(list(response.context['related_questions']), [q2])
+
+        response = self.client.get(reverse('question-similar'), {
+            'title': 'python sort list of dictionaries by value'})
+        urls = [q['url'] for q in response.json()['questions']]
+        self.assertEqual(sorted(urls), sorted([q1.get_absolute_url(),
+                                               q2.get_absolute_url()]))
+
+    def test_related_questions_are_cached_until_edited(self):
+        q1, q2, q3 = self.questions
+        self.assertEqual(related_questions(q1), [q2])
+        with self.assertNumQueries(1):  # only loading the questions
+            self.assertEqual(related_questions(q1), [q2])
+
+        q1.title = 'Which pizza topping is the best?'
+        q1.save()
+        self.assertEqual(related_questions(q1), [q3])
+
+    def test_build_command_matches_incremental_index(self):
+        expected = sorted(SimilarityBucket.objects
+                          .values_list('key', 'question_id'))
+        call_command('build_similarity_index', processes=2, batch_size=2,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(sorted(SimilarityBucket.objects
+                                .values_list('key', 'question_id')), expected)
+
+
+class LastSeenTestCase(TestCase):
+
+    def setUp(self):
+        self.asker = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.answerer = User.objects.create_user(**Pgm4appTestCase.user2)
+        self.q = Content.objects.create(content_type='q', title='Seen?',
+                                        user=self.asker)
+
+    def test_new_answer_shows_in_inbox_and_lists(self):
+        self.client.login(**Pgm4appTestCase.user1)
+        self.client.get(reverse('question-detail',
+                                args=[self.q.pk, self.q.slug]))
+        response = self.client.get(reverse('inbox'))
+        self.assertEqual(list(response.context['object_list']), [])
+
+        Content.objects.create(content_type='a', parent=self.q,
+                               user=self.answerer, text='New answer.')
+        response = self.client.get(reverse('inbox'))
+        self.assertEqual(list(response.context['object_list']), [self.q])
+
+        response = self.client.get(reverse('question-list'))
+        self.assertContains(response, 'new activity')
+
+        self.client.post(reverse('inbox'))
+        response = self.client.get(reverse('inbox'))
+        self.assertEqual(list(response.context['object_list']), [])
+        response = self.client.get(reverse('question-list'))
+        self.assertNotContains(response, 'new activity')
+
+    def test_seen_only_written_after_activity(self):
+        LastSeen.objects.mark_seen(self.asker, [self.q])
+        seen = LastSeen.objects.get().seen
+        with self.assertNumQueries(1):
+            LastSeen.objects.mark_seen(self.asker, [self.q])
+        self.assertEqual(LastSeen.objects.get().seen, seen)
+
+        answer = Content.objects.create(content_type='a', parent=self.q,
+                                        user=self.answerer, text='News.')
+        self.q.refresh_from_db()
+        LastSeen.objects.mark_seen(self.asker, [self.q])
+        self.assertGreater(LastSeen.objects.get().seen, answer.created)
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.asker = User.objects.create_user(**Pgm4appTestCase.user2)
+        self.quiet = Tag.objects.create(name='Quiet')
+        self.popular = Tag.objects.create(name='Popular', count_followers=5)
+
+    def ask(self, title, *tags):
+        question = Content.objects.create(content_type='q', title=title,
+                                          user=self.asker)
+        question.tags.add(*tags)
+        return question
+
+    def test_merges_pushed_and_popular_tags(self):
+        old = self.ask('Old quiet question', self.quiet)
+        follow(self.reader, self.quiet)
+        follow(self.reader, self.popular)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 1)
+
+        both = self.ask('In both tags', self.quiet, self.popular)
+        popular = self.ask('Popular question', self.popular)
+        quiet = self.ask('Quiet question', self.quiet)
+        self.ask('Not followed')
+        # Only the quiet tag is pushed, the popular one is read on demand.
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+
+        questions, before = get_feed(self.reader, limit=3)
+        self.assertEqual(questions, [quiet, popular, both])
+        questions, before = get_feed(self.reader, before=before, limit=3)
+        self.assertEqual((questions, before), ([old], None))
+
+        unfollow(self.reader, self.quiet)
+        questions, before = get_feed(self.reader)
+        self.assertEqual(questions, [popular, both])
+
+    @override_settings(FEED_TIMELINE_LENGTH=10)
+    def test_timelines_trimmed_on_push(self):
+        follow(self.reader, self.quiet)
+        questions = [self.ask('Question {}'.format(i), self.quiet)
+                     for i in range(12)]
+        entries = FeedEntry.objects.filter(user=self.reader)
+        self.assertEqual(entries.count(), 10)
+        self.assertEqual(entries.order_by('question_id').first().question_id,
+                         questions[2].pk)
+
+        self.ask('Question 12', self.quiet)
+        get_feed(self.reader)
+        self.assertEqual(entries.count(), 11)
+
+    def test_follow_view(self):
+        self.client.login(**Pgm4appTestCase.user1)
+        url = reverse('tag-follow', args=[self.quiet.slug])
+        self.client.post(url)
+        self.client.post(url)
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.count_followers, 1)
+
+        question = self.ask('Quiet question', self.quiet)
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(response.context['questions'], [question])
+
+
+class SitemapTestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        user = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.questions = [
+            Content.objects.create(content_type='q', title='Question {}'
+                                   .format(i), user=user) for i in range(3)]
+        self.size = self.questions[1].pk  # first two in the first chunk
+
+    def test_rebuilds_changed_chunks_only(self):
+        with self.settings(SITEMAP_ROOT=self.root,
+                           SITEMAP_CHUNK_SIZE=self.size):
+            first, second = 'questions-0.xml', 'questions-1.xml'
+            self.assertEqual(build_sitemaps(), [first, second])
+            self.assertEqual(build_sitemaps(), [])
+
+            Content.objects.create(content_type='a', text='Answer.',
+                                   parent=self.questions[0],
+                                   user=self.questions[0].user)
+            self.assertEqual(build_sitemaps(), [first])
+            self.assertEqual(build_sitemaps(force=True), [first, second])
+
+            response = self.client.get(reverse('sitemap-index',
+                                               args=['sitemap.xml']))
+            index = b''.join(response.streaming_content).decode()
+            self.assertIn('/sitemaps/questions-1.xml</loc>', index)
+            response = self.client.get(reverse('sitemap', args=[first]))
+            urls = b''.join(response.streaming_content).decode()
+            self.assertIn(self.questions[0].get_absolute_url(), urls)
+            self.assertNotIn(self.questions[2].get_absolute_url(), urls)
+
+
+class AtomFeedTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.tag = Tag.objects.create(name='Feeds')
+        self.q = Content.objects.create(content_type='q', title='First',
+                                        text='Some *markdown*.',
+                                        user=self.user)
+        self.q.tags.add(self.tag)
+
+    def test_cached_feed_and_conditional_get(self):
+        url = reverse('tag-feed', args=[self.tag.slug])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'],
+                         'application/atom+xml; charset=utf-8')
+        self.assertContains(response, '&lt;em&gt;markdown&lt;/em&gt;')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        other = Content.objects.create(content_type='q', title='Second',
+                                       user=self.user)
+        other.tags.add(self.tag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Second')
+
+        response = self.client.get(reverse('question-feed', args=['new']))
+        self.assertContains(response, 'First')
+
+    def test_conditional_get_of_compressed_feed(self):
+        url = reverse('tag-feed', args=[self.tag.slug])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].endswith(';gzip"'))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_question_without_user(self):
+        orphan = Content.objects.create(content_type='q', title='Orphan')
+        orphan.tags.add(self.tag)
+        response = self.client.get(reverse('tag-feed', args=[self.tag.slug]))
+        self.assertContains(response, 'Orphan')
+
+
+class ContentBodyTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.q = Content.objects.create(content_type='q', title='Body',
+                                        text='Some *markdown*.', user=user)
+
+    def test_lists_skip_text(self):
+        question = Content.objects.questions().headers().get()
+        self.assertIn('text', question.get_deferred_fields())
+        with self.assertNumQueries(0):
+            question.user.username
+
+    def test_body_rendered_on_save_and_when_stale(self):
+        body = ContentBody.objects.get(pk=self.q.pk)
+        self.assertEqual(body.html, '<p>Some <em>markdown</em>.</p>\n')
+
+        self.q.text = 'Changed.'
+        self.q.save()
+        ContentBody.objects.update(renderer_version=RENDERER_VERSION - 1)
+        attach_html([self.q])
+        self.assertEqual(self.q.html, '<p>Changed.</p>\n')
+        self.assertEqual(ContentBody.objects.get(pk=self.q.pk)
+                         .renderer_version, RENDERER_VERSION)
+
+    def test_edit_is_shown_before_the_body_job_ran(self):
+        with override_settings(JOBS_RUN_INLINE=False):
+            self.q.text = 'Edited.'
+            self.q.save()
+        self.assertTrue(Job.objects.filter(name='rendering.body').exists())
+        attach_html([self.q])
+        self.assertEqual(self.q.html, '<p>Edited.</p>\n')
+
+    def test_fresh_bodies_attached_without_text(self):
+        question = Content.objects.questions().headers().get()
+        with self.assertNumQueries(1):
+            attach_html([question])
+        self.assertEqual(question.html, '<p>Some <em>markdown</em>.</p>\n')
+
+        with override_settings(JOBS_RUN_INLINE=False):
+            self.q.text = 'Edited.'
+            self.q.save(update_fields=['text'])
+        question = Content.objects.questions().headers().get()
+        attach_html([question])
+        self.assertEqual(question.html, '<p>Edited.</p>\n')
+
+    def test_rerender_command(self):
+        answer = Content.objects.create(content_type='a', parent=self.q,
+                                        text='An *answer*.', user=self.q.user)
+        ContentBody.objects.filter(pk=self.q.pk).update(
+            html='old', renderer_version=RENDERER_VERSION - 1)
+        ContentBody.objects.filter(pk=answer.pk).delete()
+
+        out = StringIO()
+        call_command('rerender_content', processes=2, batch_size=1,
+                     stdout=out)
+        self.assertIn('Rendered 2 items', out.getvalue())
+        self.assertEqual(ContentBody.objects.get(pk=answer.pk).html,
+                         '<p>An <em>answer</em>.</p>\n')
+        self.assertFalse(ContentBody.objects.exclude(
+            renderer_version=RENDERER_VERSION).exists())
+
+
+class ContentAdminTestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', Pgm4appTestCase.passwd)
+        self.client.login(username='admin', password=Pgm4appTestCase.passwd)
+        self.questions = [
+            Content.objects.create(content_type='q', title='Question {}'
+                                   .format(i), user=self.admin)
+            for i in range(5)]
+        self.url = reverse('admin:pgm4app_content_changelist')
+
+    def test_changelist_and_chunked_action(self):
+        response = self.client.get(self.url, {'content_type__exact': 'q'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+        with self.settings(DB_ITERATOR_CHUNK_SIZE=2):
+            self.client.post(self.url, {
+                'action': 'mark_deleted', 'select_across': 1,
+                '_selected_action': [self.questions[0].pk]})
+        self.assertEqual(Content.objects.filter(is_deleted=True).count(), 5)
+
+    def test_hide_action_expires_feeds_and_tag_queries(self):
+        tag = Tag.objects.create(name='admin')
+        self.questions[0].tags.add(tag)
+        feed_url = reverse('tag-feed', args=[tag.slug])
+        self.assertContains(self.client.get(feed_url), 'Question 0')
+        self.assertEqual(tagged_question_ids('admin'),
+                         [self.questions[0].pk])
+
+        self.client.post(self.url, {
+            'action': 'mark_hidden',
+            '_selected_action': [self.questions[0].pk]})
+        self.assertNotContains(self.client.get(feed_url), 'Question 0')
+        self.assertEqual(tagged_question_ids('admin'), [])
+
+        self.client.post(self.url, {
+            'action': 'mark_not_hidden',
+            '_selected_action': [self.questions[0].pk]})
+        self.assertEqual(tagged_question_ids('admin'),
+                         [self.questions[0].pk])
+
+    def test_export_csv(self):
+        with self.settings(DB_ITERATOR_CHUNK_SIZE=2):
+            response = self.client.post(self.url, {
+                'action': 'export_csv',
+                '_selected_action': [q.pk for q in self.questions[1:]]})
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3],
+                         ['id', 'content_type', 'title'])
+        self.assertEqual(len(lines), 5)
+        self.assertIn('Question 1', lines[1])
+
+
+@override_settings(JOBS_RUN_INLINE=False, JOBS_MAX_ATTEMPTS=2,
+                   JOBS_RETRY_DELAY=0)
+class JobQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        jobs.register('test.batch', batch=True)(self.calls.append)
+        jobs.register('test.fail')(lambda payload: 1 / 0)
+        self.addCleanup(jobs._registry.pop, 'test.batch')
+        self.addCleanup(jobs._registry.pop, 'test.fail')
+
+    def test_dedup_batch_and_retry(self):
+        jobs.enqueue('test.batch', {'n': 1}, dedup_key='n')
+        jobs.enqueue('test.batch', {'n': 1}, dedup_key='n')
+        jobs.enqueue('test.batch', {'n': 2})
+        jobs.enqueue('test.fail')
+        self.assertEqual(Job.objects.count(), 3)
+
+        with self.assertLogs('pgm4app.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 3)
+        self.assertEqual(self.calls, [[{'n': 1}, {'n': 2}]])
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts), ('p', 1))
+
+        with self.assertLogs('pgm4app.jobs', 'ERROR'):
+            jobs.run_pending()
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), ('f', 2))
+        self.assertIn('ZeroDivisionError', failed.last_error)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_vote_side_effects_are_queued(self):
+        user = User.objects.create_user(**Pgm4appTestCase.user1)
+        question = Content.objects.create(content_type='q', title='Queued',
+                                          user=user)
+        question.toggle_vote(user, 1)
+        self.assertFalse(TrendCounter.objects.exists())
+        jobs.run_pending()
+        self.assertTrue(TrendCounter.objects.filter(kind='q').exists())
+        self.assertTrue(ContentBody.objects.filter(pk=question.pk).exists())
+        self.assertFalse(Job.objects.exists())
+
+
+class ProfilerTestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        User.objects.create_superuser('admin', 'admin@example.com',
+                                      Pgm4appTestCase.passwd)
+        self.client.login(username='admin', password=Pgm4appTestCase.passwd)
+
+    def test_staff_header_profiles_view(self):
+        for mode, extension in (('cprofile', 'prof'), ('sample', 'folded')):
+            with self.settings(PROFILER_ENABLED=True, PROFILER_DIR=self.root,
+                               PROFILER_MODE=mode, PROFILER_SAMPLE_RATE=0):
+                self.client.get(reverse('tag-list'))
+                response = self.client.get(reverse('tag-list'),
+                                           HTTP_X_PROFILE='1')
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['X-Profile'].startswith('tag-list/'))
+                self.assertTrue(response['X-Profile'].endswith(extension))
+
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'tag-list'))),
+                         2)
+        out = StringIO()
+        with self.settings(PROFILER_DIR=self.root):
+            call_command('profile_report', stdout=out)
+        self.assertIn('== tag-list: 1 cProfile dumps', out.getvalue())
+        self.assertTrue(os.path.isfile(os.path.join(self.root,
+                                                    'tag-list.folded')))
+
+
+class AcceptAnswerTestCase(TestCase):
+
+    def setUp(self):
+        self.asker = User.objects.create_user(**Pgm4appTestCase.user1)
+        self.answerer = User.objects.create_user(**Pgm4appTestCase.user2)
+        self.q = Content.objects.create(content_type='q', title='Accept?',
+                                        user=self.asker)
+        self.a1, self.a2 = [
+            Content.objects.create(content_type='a', parent=self.q,
+                                   text='Answer.', user=self.answerer)
+            for _ in range(2)]
+
+    def test_only_asker_accepts_one_answer(self):
+        self.client.login(**Pgm4appTestCase.user2)
+        response = self.client.post(reverse('accept', args=[self.a1.pk]))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(**Pgm4appTestCase.user1)
+        self.client.post(reverse('accept', args=[self.a1.pk]))
+        self.client.post(reverse('accept', args=[self.a2.pk]))
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.accepted_answer_id, self.a2.pk)
+        self.assertEqual(list(Content.objects.filter(is_accepted=True)),
+                         [self.a2])
+        self.assertEqual(list(self.q.answers())[0], self.a2)
+        self.assertFalse(Content.objects.questions_without_accepted_answer()
+                         .exists())
+
+        self.client.post(reverse('unaccept', args=[self.a2.pk]))
+        self.q.refresh_from_db()
+        self.assertIsNone(self.q.accepted_answer_id)
+        self.assertFalse(Content.objects.filter(is_accepted=True).exists())
@@ -0,0 +1,111 @@
+"""
+Load a question thread (a page of answers, the first comments on the
+question and on each answer, and the current user's votes on all of them)
+with a bounded number of queries, so that rendering the thread never hits
+the database and takes the same time for a thread with thousands of posts.
+
+Further answers and comments are loaded page by page with keyset cursors:
+answers are ordered by (-timepoints, -pk) after the accepted answer, so the
+cursor of an answers page is the "timepoints_pk" of its last answer. The
+cursor of a comments page is the pk of its last comment.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from pgm4app.models import Content
+from pgm4app.rendering import attach_html
+
+
+def answers_cursor(answer):
+    return '{}_{}'.format(answer.timepoints, answer.pk)
+
+
+def parse_answers_cursor(value):
+    """Return the (timepoints, pk) of a cursor, None for a broken value."""
+    try:
+        timepoints, pk = value.split('_')
+        return int(timepoints), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def answers_page(question, after=None, limit=None):
+    """
+    Return a page of the public answers to the question in answers() order
+    and the cursor of the next page, None after the last page. The first
+    page starts with the accepted answer, which doesn't count against the
+    limit.
+    """
+    limit = limit or settings.THREAD_ANSWERS_PAGE_SIZE
+    accepted_id = question.accepted_answer_id
+    answers = question.answers().select_related('user').defer('text')
+    if after is None:
+        answers = list(answers[:limit + 1 + bool(accepted_id)])
+    else:
+        timepoints, pk = after
+        answers = list(answers.exclude(pk=accepted_id).filter(
+            Q(timepoints__lt=timepoints) |
+            Q(timepoints=timepoints, pk__lt=pk))[:limit + 1])
+
+    accepted = [a for a in answers if a.pk == accepted_id]
+    others = [a for a in answers if a.pk != accepted_id]
+    cursor = answers_cursor(others[limit - 1]) if len(others) > limit \
+        else None
+    return accepted + others[:limit], cursor
+
+
+def comments_page(parent, after=None, limit=None):
+    """
+    Return a page of the public comments on a question or answer, oldest
+    first, and the cursor of the next page, None after the last page.
+    """
+    limit = limit or settings.THREAD_COMMENTS_PAGE_SIZE
+    comments = Content.objects.public().comments()\
+        .filter(parent_id=parent.pk).select_related('user')
+    if after is not None:
+        comments = comments.filter(pk__gt=after)
+    comments = list(comments[:limit + 1])
+    cursor = comments[limit - 1].pk if len(comments) > limit else None
+    return comments[:limit], cursor
+
+
+def attach_comments(parents, limit=None):
+    """
+    Set the "comment_list" and "comments_cursor" attributes of every parent
+    to its first page of comments. Parents whose count_comments fits into
+    one page share one query, every larger parent gets a query with a
+    limit, so no parent loads more than one page.
+    """
+    limit = limit or settings.THREAD_COMMENTS_PAGE_SIZE
+    small = [p.pk for p in parents if p.count_comments <= limit]
+    by_parent = {}
+    if small:
+        comments = Content.objects.public().comments()\
+            .filter(parent_id__in=small).select_related('user')
+        for comment in comments:
+            by_parent.setdefault(comment.parent_id, []).append(comment)
+
+    for parent in parents:
+        if parent.count_comments <= limit:
+            parent.comment_list = by_parent.get(parent.pk, [])
+            parent.comments_cursor = None
+        else:
+            parent.comment_list, parent.comments_cursor = \
+                comments_page(parent, limit=limit)
+    return [c for p in parents for c in p.comment_list]
+
+
+def load_thread(question, user, after=None):
+    """
+    Return a page of public answers for the question (see answers_page())
+    and set its cursor as the question's "answers_cursor". Each answer gets
+    a "comment_list" attribute with its first public comments and an "html"
+    attribute with its rendered text, and all of them have the user's votes
+    attached. The question itself is only included on the first page.
+    """
+    answers, question.answers_cursor = answers_page(question, after)
+    parents = answers if after else [question] + answers
+    children = attach_comments(parents)
+    Content.attach_user_votes(parents + children, user)
+    attach_html(parents)
+    return answers
@@ -0,0 +1,182 @@
+"""
+Personal question feeds for users following tags.
+
+Two strategies, chosen per tag by its number of followers:
+
+- Fan-out on write: a new question in a tag with at most
+  settings.FEED_FANOUT_MAX_FOLLOWERS followers is pushed into a bounded
+  timeline (models.FeedEntry) of every follower. Reading it is a single index
+  range scan, no matter how many of those tags the user follows.
+- Merge on read: pushing into the timelines of thousands of followers on
+  every new question is too expensive, so questions in popular tags are
+  pulled when the feed is read instead. The recent question ids of each
+  popular tag are a sorted list in the cache, shared by all its followers,
+  and the feed is a k-way merge of those lists and the user's own timeline.
+
+Both sides reach back settings.FEED_TIMELINE_LENGTH questions per user or
+tag respectively. Timelines are trimmed by fan_out() once they grow a tenth
+past that, so reading the feed never writes. The id lists of popular tags
+expire after settings.FEED_TAG_IDS_MAX_AGE seconds, or when a question is
+added to the tag. The feed is paginated by question id ("?before=<pk>").
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from pgm4app.models import Content, FeedEntry, Tag, TagFollow
+
+
+def tag_ids_cache_key(tag_id):
+    return 'tag-question-ids:{}'.format(tag_id)
+
+
+def is_popular(tag):
+    return tag.count_followers > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def follow(user, tag):
+    """Follow the tag, return False if the user already followed it."""
+    try:
+        with transaction.atomic():
+            TagFollow.objects.create(user=user, tag=tag)
+    except IntegrityError:
+        return False
+
+    Tag.objects.filter(pk=tag.pk)\
+        .update(count_followers=F('count_followers') + 1)
+    tag.count_followers += 1
+    if not is_popular(tag):
+        # Fill the timeline with what the tag had so far.
+        ids = _recent_question_ids(tag.pk)
+        _push(question_ids=ids, user_ids=[user.pk], tag_id=tag.pk)
+        trim_timeline(user.pk)
+    return True
+
+
+def unfollow(user, tag):
+    """Stop following the tag, return False if the user didn't follow it."""
+    deleted, _ = TagFollow.objects.filter(user=user, tag=tag).delete()
+    if not deleted:
+        return False
+
+    Tag.objects.filter(pk=tag.pk, count_followers__gt=0)\
+        .update(count_followers=F('count_followers') - 1)
+    tag.count_followers = max(tag.count_followers - 1, 0)
+    FeedEntry.objects.filter(user=user, tag=tag).delete()
+    return True
+
+
+def fan_out(question, tag_ids):
+    """
+    Push a question into the timelines of the followers of those of its
+    tags that are not popular, and expire the id lists of the popular ones.
+    """
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    tags = Tag.objects.filter(pk__in=tag_ids, count_followers__gt=0)\
+        .values_list('pk', 'count_followers')
+    popular = [pk for pk, followers in tags if followers > limit]
+    cache.delete_many([tag_ids_cache_key(pk) for pk in popular])
+
+    # A follower of several of these tags gets the question once.
+    followers = {}
+    follows = TagFollow.objects.filter(
+        tag_id__in=tag_ids, tag__count_followers__gt=0,
+        tag__count_followers__lte=limit).values_list('user_id', 'tag_id')
+    for user_id, tag_id in follows:
+        followers.setdefault(tag_id, set()).add(user_id)
+    seen = set()
+    for tag_id, user_ids in sorted(followers.items()):
+        _push([question.pk], user_ids - seen, tag_id)
+        seen |= user_ids
+
+    # Trim in steps of a tenth of the length, not on every push.
+    length = settings.FEED_TIMELINE_LENGTH
+    full = FeedEntry.objects.filter(user_id__in=seen).values('user_id')\
+        .annotate(entries=Count('pk'))\
+        .filter(entries__gt=length + length // 10)
+    for user_id in full.values_list('user_id', flat=True):
+        trim_timeline(user_id)
+
+
+def _push(question_ids, user_ids, tag_id):
+    if not question_ids or not user_ids:
+        return
+    existing = set(FeedEntry.objects.filter(
+        user_id__in=user_ids, question_id__in=question_ids)
+        .values_list('user_id', 'question_id'))
+    entries = [FeedEntry(user_id=user_id, question_id=question_id,
+                         tag_id=tag_id)
+               for user_id in user_ids for question_id in question_ids
+               if (user_id, question_id) not in existing]
+    try:
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create(entries, batch_size=500)
+    except IntegrityError:
+        pass  # A concurrent push got there first, the entries exist.
+
+
+def trim_timeline(user_id):
+    """Drop all but the newest settings.FEED_TIMELINE_LENGTH entries."""
+    length = settings.FEED_TIMELINE_LENGTH
+    cutoff = FeedEntry.objects.filter(user_id=user_id)\
+        .order_by('-question_id')\
+        .values_list('question_id', flat=True)[length:length + 1]
+    cutoff = list(cutoff)
+    if cutoff:
+        FeedEntry.objects.filter(user_id=user_id,
+                                 question_id__lte=cutoff[0]).delete()
+
+
+def _recent_question_ids(tag_id):
+    """Newest first ids of the public questions with this tag."""
+    return list(Content.objects.public().questions().filter(tags=tag_id)
+                .order_by('-pk').values_list('pk', flat=True)
+                [:settings.FEED_TIMELINE_LENGTH])
+
+
+def popular_tag_question_ids(tag_ids):
+    """Return a list of recent question ids, newest first, for each tag."""
+    keys = {tag_ids_cache_key(pk): pk for pk in tag_ids}
+    lists = cache.get_many(keys.keys())
+    for key, tag_id in keys.items():
+        if key not in lists:
+            lists[key] = _recent_question_ids(tag_id)
+            cache.set(key, lists[key], settings.FEED_TAG_IDS_MAX_AGE)
+    return list(lists.values())
+
+
+def get_feed(user, before=None, limit=None):
+    """
+    Return a page of questions from the tags the user follows, newest first,
+    and the "before" value for the next page (None on the last page).
+    """
+    limit = limit or settings.FEED_PAGE_SIZE
+    popular = TagFollow.objects.filter(
+        user=user, tag__count_followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+    popular = popular.values_list('tag_id', flat=True)
+
+    pushed = FeedEntry.objects.filter(user=user).order_by('-question_id')
+    if before is not None:
+        pushed = pushed.filter(question_id__lt=before)
+    id_lists = [list(pushed.values_list('question_id', flat=True)[:limit])]
+    for ids in popular_tag_question_ids(list(popular)):
+        if before is not None:
+            ids = [pk for pk in ids if pk < before]
+        id_lists.append(ids[:limit])
+
+    ids = []
+    for pk in heapq.merge(*id_lists, reverse=True):
+        if ids and ids[-1] == pk:
+            continue  # Pushed and in a popular tag, or in two popular tags.
+        if len(ids) == limit:
+            next_before = ids[-1]
+            break
+        ids.append(pk)
+    else:
+        next_before = None
+
+    questions = Content.objects.public().questions().headers().in_bulk(ids)
+    return [questions[pk] for pk in ids if pk in questions], next_before
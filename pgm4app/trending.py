@@ -0,0 +1,112 @@
+"""
+Rolling window counters for "what is getting votes and answers right now".
+
+Every vote or answer increments the current slot of a ring buffer for the
+question and for each of its tags (see models.TrendCounter). A trending
+score is the sum of the slots whose bucket is still inside the window. Old
+buckets are never deleted, they are overwritten when the ring comes around,
+and reading scores is an index range scan over the recent buckets only.
+Events that arrive after their bucket left the window (e.g. from a late
+job) are dropped, and never overwrite a slot that holds a newer bucket.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, F, Q, Sum, Value, IntegerField
+
+from pgm4app.models import Tag, TrendCounter
+
+
+def current_bucket(seconds, timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+    return int(timestamp) // seconds
+
+
+def record_event(question, weight=1, tag_ids=None, timestamp=None):
+    """
+    Count an event (a vote or an answer) for the question and its tags in
+    every ring of settings.TRENDING_RINGS.
+    """
+    if tag_ids is None:
+        tag_ids = list(question.tags.values_list('pk', flat=True))
+    keys = [('q', question.pk)] + [('t', pk) for pk in tag_ids]
+
+    for resolution, (seconds, slots) in settings.TRENDING_RINGS.items():
+        bucket = current_bucket(seconds, timestamp)
+        if bucket < current_bucket(seconds) - slots + 1:
+            continue  # outside the window already
+        _increment(keys, resolution, bucket, bucket % slots, weight)
+
+
+def _increment(keys, resolution, bucket, slot, weight):
+    match = Q()
+    for kind in set(k for k, _ in keys):
+        match |= Q(kind=kind, object_id__in=[o for k, o in keys if k == kind])
+    counters = TrendCounter.objects.filter(match, resolution=resolution,
+                                           slot=slot)
+
+    # A slot still holding an older bucket restarts counting from zero, a
+    # slot that already holds a newer bucket is left alone.
+    updated = counters.filter(bucket__lte=bucket).update(
+        count=Case(When(bucket=bucket, then=F('count') + weight),
+                   default=Value(weight), output_field=IntegerField()),
+        bucket=bucket)
+    if updated == len(keys):
+        return
+
+    existing = set(counters.values_list('kind', 'object_id'))
+    missing = [key for key in keys if key not in existing]
+    try:
+        with transaction.atomic():
+            TrendCounter.objects.bulk_create([
+                TrendCounter(kind=kind, object_id=object_id, slot=slot,
+                             resolution=resolution, bucket=bucket, count=weight)
+                for kind, object_id in missing])
+    except IntegrityError:
+        # Another request created some of the rows first, count into those.
+        _increment(missing, resolution, bucket, slot, weight)
+
+
+def top(kind, limit, resolution=None):
+    """
+    Return a list of (object_id, score) tuples with the highest scores in
+    the window of the given ring, highest first.
+    """
+    resolution = resolution or settings.TRENDING_DEFAULT_RING
+    seconds, slots = settings.TRENDING_RINGS[resolution]
+    oldest = current_bucket(seconds) - slots + 1
+
+    rows = TrendCounter.objects\
+        .filter(kind=kind, resolution=resolution, bucket__gte=oldest)\
+        .values('object_id').annotate(score=Sum('count'))\
+        .order_by('-score', '-object_id')[:limit]
+    return [(row['object_id'], row['score']) for row in rows]
+
+
+def trending_question_ids():
+    """Return the ids of the currently trending questions, best first."""
+    key = 'trending:questions'
+    ids = cache.get(key)
+    if ids is None:
+        ids = [pk for pk, _ in top('q', settings.TRENDING_QUESTIONS_LIMIT)]
+        cache.set(key, ids, settings.TRENDING_CACHE_TIMEOUT)
+    return ids
+
+
+def trending_tags(limit=10):
+    """Return a list of Tag objects with a "score" attribute, best first."""
+    key = 'trending:tags:{}'.format(limit)
+    tags = cache.get(key)
+    if tags is None:
+        scores = top('t', limit)
+        by_id = Tag.objects.in_bulk([pk for pk, _ in scores])
+        tags = []
+        for pk, score in scores:
+            if pk in by_id:
+                by_id[pk].score = score
+                tags.append(by_id[pk])
+        cache.set(key, tags, settings.TRENDING_CACHE_TIMEOUT)
+    return tags
@@ -38,3 +38,63 @@ def login_required_ajax(function=None, redirect_field_name=None):
         return _decorator
     else:
         return _decorator(function)
+
+
+def iterate_in_chunks(queryset, chunk_size=None):
+    """
+    Iterate over a large queryset in primary key order, fetching only
+    chunk_size rows per query. Each query continues after the last seen pk,
+    so it stays an index range scan no matter how far in we are, and no
+    more than one chunk is ever held in memory.
+
+    The queryset may be a values() or values_list() queryset, but then the
+    pk must be its first (values_list) or an included (values) column.
+    """
+    if chunk_size is None:
+        chunk_size = settings.DB_ITERATOR_CHUNK_SIZE
+
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+
+        for row in rows:
+            yield row
+
+        last = rows[-1]
+        if isinstance(last, dict):
+            last_pk = last['pk'] if 'pk' in last else last['id']
+        elif isinstance(last, (tuple, list)):
+            last_pk = last[0]
+        elif isinstance(last, int):
+            last_pk = last  # values_list('pk', flat=True)
+        else:
+            last_pk = last.pk
+
+        if len(rows) < chunk_size:
+            return
+
+
+def update_in_chunks(queryset, chunk_size=None, **values):
+    """
+    Update all rows of a large queryset with one short UPDATE per chunk of
+    primary keys, instead of a single statement that locks every row until
+    it is done. Return the number of updated rows.
+    """
+    model = queryset.model
+    pks = iterate_in_chunks(queryset.values_list('pk', flat=True), chunk_size)
+    count = 0
+    chunk = []
+    for pk in pks:
+        chunk.append(pk)
+        if len(chunk) == (chunk_size or settings.DB_ITERATOR_CHUNK_SIZE):
+            count += model.objects.filter(pk__in=chunk).update(**values)
+            chunk = []
+    if chunk:
+        count += model.objects.filter(pk__in=chunk).update(**values)
+    return count
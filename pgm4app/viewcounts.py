@@ -0,0 +1,155 @@
+"""
+Count unique viewers of questions with HyperLogLog sketches (see
+pgm4app.hll) instead of writing a row on every page view.
+
+Every process adds its views to one in-memory sketch per question, keyed on
+a hash of the user, the session or the IP address and user agent, so that
+reloads count once. Bots and the author are not counted. At most every
+VIEW_FLUSH_INTERVAL seconds, or when VIEW_MAX_PENDING questions have
+sketches, the sketches are handed to a "views.merge" job. The job is always
+queued, also with JOBS_RUN_INLINE, so that no visitor's request waits for
+it. It merges them into the stored sketch of the day and of all time, and
+adds the growth of the all time estimate to Content.count_views. Views
+since the last flush of a process that exits are lost, which an estimate
+can afford.
+
+The daily sketches merge into unique viewer counts of any range of days,
+see unique_viewers().
+"""
+import base64
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_date
+from django.utils.timezone import now
+
+from pgm4app.hll import HyperLogLog
+from pgm4app.jobs import enqueue
+from pgm4app.models import Content, ViewSketch
+
+
+def new_sketch():
+    return HyperLogLog(settings.VIEW_SKETCH_PRECISION)
+
+
+def load_sketch(data):
+    return HyperLogLog.from_bytes(data, settings.VIEW_SKETCH_PRECISION)
+
+
+def visitor_key(request):
+    if request.user.is_authenticated():
+        return 'u:{}'.format(request.user.pk)
+    session_key = request.session.session_key
+    if session_key:
+        return 's:{}'.format(session_key)
+    return 'a:{}:{}'.format(request.META.get('REMOTE_ADDR', ''),
+                            request.META.get('HTTP_USER_AGENT', ''))
+
+
+def is_bot(request):
+    return bool(re.search(settings.VIEW_COUNT_BOT_PATTERN,
+                          request.META.get('HTTP_USER_AGENT', ''), re.I))
+
+
+_lock = threading.Lock()
+_state = {'day': None, 'sketches': {}, 'flushed': time.time()}
+
+
+def record_view(request, question):
+    """Count a view of the question by the requesting visitor."""
+    if question.user_id is not None and question.user_id == request.user.pk:
+        return
+    if is_bot(request):
+        return
+
+    key = visitor_key(request)
+    today = now().date()
+    flush = []
+    with _lock:
+        if _state['day'] != today:
+            flush.append(_take())
+            _state['day'] = today
+        sketches = _state['sketches']
+        if question.pk not in sketches:
+            sketches[question.pk] = new_sketch()
+        sketches[question.pk].add(key)
+        if len(sketches) >= settings.VIEW_MAX_PENDING or \
+                time.time() - _state['flushed'] >= \
+                settings.VIEW_FLUSH_INTERVAL:
+            flush.append(_take())
+
+    for day, sketches in flush:
+        if sketches:
+            enqueue('views.merge', {
+                'day': day.isoformat(),
+                'sketches': {str(pk): base64.b64encode(s.to_bytes()).decode()
+                             for pk, s in sketches.items()}}, inline=False)
+
+
+def _take():
+    """Return and reset the pending sketches, call with _lock held."""
+    taken = (_state['day'], _state['sketches'])
+    _state['sketches'] = {}
+    _state['flushed'] = time.time()
+    return taken
+
+
+def merge_sketches(day, sketches):
+    """
+    Merge {question id: HyperLogLog} into the stored sketches of the day
+    and of all time, and update count_views.
+    """
+    for question_id, sketch in sorted(sketches.items()):
+        with transaction.atomic():
+            # Lock the question, so that merges of the same question from
+            # several workers can't overwrite each other.
+            if not Content.objects.select_for_update()\
+                    .filter(pk=question_id).exists():
+                continue
+            for sketch_day in (day, None):
+                row = ViewSketch.objects.filter(
+                    question_id=question_id, day=sketch_day).first() or \
+                    ViewSketch(question_id=question_id, day=sketch_day,
+                               registers=new_sketch().to_bytes())
+                merged = load_sketch(row.registers)
+                merged.update(sketch)
+                previous, row.estimate = row.estimate, merged.count()
+                row.registers = merged.to_bytes()
+                row.save()
+            # row is the all time sketch now.
+            if row.estimate > previous:
+                Content.objects.filter(pk=question_id).update(
+                    count_views=F('count_views') + row.estimate - previous)
+
+
+def merge_payload(payload):
+    merge_sketches(parse_date(payload['day']), {
+        int(pk): load_sketch(base64.b64decode(data))
+        for pk, data in payload['sketches'].items()})
+
+
+def unique_viewers(question, first_day, last_day):
+    """Estimate the unique viewers of a question over a range of days."""
+    sketch = new_sketch()
+    for data in ViewSketch.objects.filter(
+            question=question, day__range=(first_day, last_day))\
+            .values_list('registers', flat=True).iterator():
+        sketch.update(load_sketch(data))
+    return sketch.count()
+
+
+def daily_viewers(question, days):
+    """Return (day, estimate) for the last days, oldest first."""
+    today = now().date()
+    first_day = today - timedelta(days=days - 1)
+    estimates = dict(ViewSketch.objects.filter(
+        question=question, day__range=(first_day, today))
+        .values_list('day', 'estimate'))
+    return [(first_day + timedelta(days=i),
+             estimates.get(first_day + timedelta(days=i), 0))
+            for i in range(days)]
@@ -1,23 +1,56 @@
+import difflib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.urlresolvers import reverse
-from django.http import Http404, JsonResponse
-from django.http.response import HttpResponseRedirect
+from django.db.models import F, Q
+from django.http import Http404, JsonResponse, FileResponse, \
+    HttpResponseForbidden
+from django.http.response import HttpResponseRedirect, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 from django.views.generic import TemplateView, CreateView, UpdateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
+from django.views.static import was_modified_since
 
+from pgm4app.dashboard import get_sections
 from pgm4app.forms import AskForm, AnswerForm, CommentForm
-from pgm4app.models import Content, Tag
+from pgm4app.middleware import parse_accept_encoding
+from pgm4app.models import Content, LastSeen, Revision, Tag
+from pgm4app.postings import QuestionPage, tagged_question_ids
+from pgm4app.revisions import revision_texts
+from pgm4app.similarity import related_questions, similar_questions
+from pgm4app.tagindex import autocomplete
+from pgm4app.threads import comments_page, load_thread, \
+    parse_answers_cursor
+from pgm4app.timelines import follow, get_feed, unfollow
+from pgm4app.trending import trending_tags
 from pgm4app.utils import login_required_ajax
+from pgm4app.viewcounts import record_view
 
 
 class HomeView(TemplateView):
+    """The dashboard, rendered from a cached snapshot, see
+    pgm4app.dashboard."""
     template_name = 'pgm4app/home.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sections'] = get_sections()
+        return context
+
 
 class UserListView(ListView):
     model = User
@@ -32,7 +65,7 @@ class UserDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         context['active_on_navbar'] = 'profile'
         context['questions'] = \
-            Content.objects.questions().by_user(self.request.user)
+            Content.objects.questions().by_user(self.request.user).headers()
         return context
 
 
@@ -51,9 +84,59 @@ class TagDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['active_on_navbar'] = 'tags'
+        if self.request.user.is_authenticated():
+            context['is_following'] = self.object.follows\
+                .filter(user=self.request.user).exists()
+        return context
+
+
+@method_decorator(login_required_ajax, name='dispatch')
+class TagFollowView(View):
+    def post(self, *args, **kwargs):
+        tag = get_object_or_404(Tag, slug=kwargs['slug'])
+        if kwargs['follow']:
+            follow(self.request.user, tag)
+        else:
+            unfollow(self.request.user, tag)
+
+        if self.request.is_ajax():
+            return JsonResponse({'count_followers': tag.count_followers})
+        return HttpResponseRedirect(reverse('tag-detail', args=[tag.slug]))
+
+
+@method_decorator(login_required, name='dispatch')
+class FeedView(TemplateView):
+    """Newest questions in the tags the user follows."""
+    template_name = 'pgm4app/feed.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            before = int(self.request.GET['before'])
+        except (KeyError, ValueError):
+            before = None
+        context['active_on_navbar'] = 'feed'
+        context['questions'], context['next_before'] = \
+            get_feed(self.request.user, before)
+        context['followed_tags'] = Tag.objects\
+            .filter(follows__user=self.request.user).order_by('slug')
         return context
 
 
+class TagAutocompleteView(View):
+    """
+    Return tags whose slug starts with the "q" parameter, most popular
+    first, from the in-process tag index.
+    """
+
+    def get(self, request, *args, **kwargs):
+        matches = autocomplete(request.GET.get('q', ''),
+                               limit=settings.TAG_AUTOCOMPLETE_LIMIT)
+        tags = [{'slug': slug, 'name': name, 'count': count}
+                for slug, name, count in matches]
+        return JsonResponse({'tags': tags})
+
+
 class QuestionCreateView(CreateView):
     form_class = AskForm
     template_name = 'pgm4app/question_create.html'
@@ -69,6 +152,7 @@ class QuestionCreateView(CreateView):
         form.instance.content_type = Content.get_content_type_id('question')
         form.instance.user = self.request.user
         form.save()
+        LastSeen.objects.mark_seen(self.request.user, [form.instance])
         messages.success(self.request, _('Your question was published.'))
         return super().form_valid(form)
 
@@ -76,6 +160,19 @@ class QuestionCreateView(CreateView):
         return self.object.get_absolute_url()
 
 
+class SimilarQuestionsView(View):
+    """
+    Return questions similar to the "title" parameter, to point the user to
+    possible duplicates while they type a new question.
+    """
+
+    def get(self, request, *args, **kwargs):
+        questions = similar_questions(request.GET.get('title', '')[:200])
+        return JsonResponse({'questions': [
+            {'title': q.title, 'url': q.get_absolute_url(),
+             'similarity': round(q.similarity, 2)} for q in questions]})
+
+
 class QuestionUpdateView(UpdateView):
     model = Content
     form_class = AskForm
@@ -85,6 +182,7 @@ class QuestionUpdateView(UpdateView):
         return super().get_queryset().filter(user=self.request.user)
 
     def form_valid(self, form):
+        form.instance.edited = now()
         messages.success(self.request, _('Your question was updated.'))
         return super().form_valid(form)
 
@@ -93,42 +191,130 @@ class QuestionUpdateView(UpdateView):
 
 
 class QuestionListView(ListView):
+    """
+    The question list. With a "tags" query (e.g. "python AND django NOT
+    beginner") only matching questions are listed, newest first, see
+    pgm4app.postings.
+    """
     template_name = 'pgm4app/question_list.html'
     paginate_by = 5
 
     def _get_order(self):
+        if self._get_tag_query():
+            return 'new'
         order = self.request.GET.get('order', 'hot')
-        return order if order in ['hot', 'new', 'top'] else 'hot'
+        return order if order in ['hot', 'new', 'top', 'trending'] else 'hot'
+
+    def _get_tag_query(self):
+        return self.request.GET.get('tags', '').strip()[:200]
 
     def get_queryset(self):
+        tag_query = self._get_tag_query()
+        if tag_query:
+            return QuestionPage(tagged_question_ids(tag_query),
+                                Content.objects.public().headers())
         order = self._get_order()
-        return Content.objects.public().questions().order(order)
+        return Content.objects.public().questions().order(order).headers()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['active_on_navbar'] = self._get_order()
+        context['tag_query'] = self._get_tag_query()
+        context['trending_tags'] = trending_tags()
         return context
 
 
 class QuestionDetailView(DetailView):
-    queryset = Content.objects.public().questions()
+    queryset = Content.objects.public().questions().select_related('user')
     template_name = 'pgm4app/question_detail.html'
     slug_field = 'username'
     slug_url_kwarg = 'username'
 
     def get_object(self, queryset=None):
         _object = super().get_object(queryset=queryset)
-        _object.attach_user_vote(self.request.user)
-        _object.count_view()
+        record_view(self.request, _object)
+        if self.request.user.is_authenticated():
+            LastSeen.objects.mark_seen(self.request.user, [_object])
         return _object
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['answers'] = load_thread(self.object, self.request.user)
+        context['related_questions'] = related_questions(self.object)
         context['answer_form'] = AnswerForm
         context['answer_form_url'] = reverse('answer-create', args=[self.object.pk])
         return context
 
 
+class AnswerPageView(DetailView):
+    """
+    The answers after the "after" cursor, as the HTML fragment that the
+    "show more answers" link of a question page is replaced with.
+    """
+    queryset = Content.objects.public().questions()
+    template_name = 'pgm4app/answer_page_partial.html'
+
+    def get_context_data(self, **kwargs):
+        after = parse_answers_cursor(self.request.GET.get('after'))
+        if after is None:
+            raise Http404
+        context = super().get_context_data(**kwargs)
+        context['answers'] = load_thread(self.object, self.request.user,
+                                         after)
+        return context
+
+
+class CommentPageView(DetailView):
+    """
+    The comments on a question or answer after the "after" cursor, as the
+    HTML fragment that the "show more comments" link is replaced with.
+    """
+    queryset = Content.objects.public().exclude(content_type='c')
+    template_name = 'pgm4app/comment_page_partial.html'
+
+    def get_context_data(self, **kwargs):
+        try:
+            after = int(self.request.GET['after'])
+        except (KeyError, ValueError):
+            raise Http404
+        context = super().get_context_data(**kwargs)
+        comments, self.object.comments_cursor = \
+            comments_page(self.object, after)
+        context['comments'] = Content.attach_user_votes(
+            comments, self.request.user)
+        context['parent'] = self.object
+        return context
+
+
+class RevisionsView(DetailView):
+    """
+    The edit history of a post. With a "diff" parameter, the changes made
+    by the edit that replaced that revision.
+    """
+    queryset = Content.objects.public()
+    template_name = 'pgm4app/revisions.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        revisions = self.object.revisions.defer('data')\
+            .order_by('-replaced', '-pk')
+        context['revisions'] = revisions
+        if 'diff' in self.request.GET:
+            try:
+                revision = revisions.get(pk=int(self.request.GET['diff']))
+            except (ValueError, Revision.DoesNotExist):
+                raise Http404
+            try:
+                old, new = revision_texts(revision)
+            except ValueError:
+                context['incomplete'] = True
+            else:
+                context['revision'] = revision
+                context['diff'] = list(difflib.unified_diff(
+                    old.splitlines(), new.splitlines(), lineterm=''))[2:]
+        return context
+
+
 class AnswerCreateView(CreateView):
     form_class = AnswerForm
     template_name = 'pgm4app/answer_create.html'
@@ -167,6 +353,7 @@ class AnswerUpdateView(UpdateView):
         return super().get_queryset().filter(user=self.request.user)
 
     def form_valid(self, form):
+        form.instance.edited = now()
         messages.success(self.request, _('Your answer was updated.'))
         return super().form_valid(form)
 
@@ -230,6 +417,7 @@ class CommentUpdateView(UpdateView):
         return super().get_queryset().filter(user=self.request.user)
 
     def form_valid(self, form):
+        form.instance.edited = now()
         messages.success(self.request, _('Your comment was updated.'))
         return super().form_valid(form)
 
@@ -244,6 +432,34 @@ class CommentUpdateView(UpdateView):
         return context
 
 
+@method_decorator(login_required, name='dispatch')
+class InboxView(ListView):
+    """
+    Questions the user has seen before that were answered or edited since,
+    most recent activity first.
+    """
+    template_name = 'pgm4app/inbox.html'
+    paginate_by = 20
+
+    def get_queryset(self):
+        user = self.request.user
+        return Content.objects.public().questions()\
+            .filter(Q(last_answered__gt=F('last_seen__seen')) |
+                    Q(edited__gt=F('last_seen__seen')),
+                    last_seen__user=user)\
+            .headers().order_by('-last_answered')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['active_on_navbar'] = 'inbox'
+        return context
+
+    def post(self, request, *args, **kwargs):
+        """Mark all questions in the inbox as seen."""
+        LastSeen.objects.mark_seen(request.user, self.get_queryset())
+        return HttpResponseRedirect(reverse('inbox'))
+
+
 @method_decorator(login_required_ajax, name='dispatch')
 class VoteView(View):
     def post(self, *args, **kwargs):
@@ -257,3 +473,95 @@ class VoteView(View):
         _hash = self.request.POST.get('hash', '')
         _hash = '#{}'.format(_hash) if _hash else ''
         return HttpResponseRedirect(_next + _hash)
+
+
+@method_decorator(login_required_ajax, name='dispatch')
+class AcceptView(View):
+    """Accept or unaccept an answer, only the asker may do that."""
+
+    def post(self, *args, **kwargs):
+        answer = get_object_or_404(
+            Content.objects.answers().select_related('parent'),
+            pk=kwargs['pk'])
+        if answer.parent.user_id != self.request.user.pk:
+            return HttpResponseForbidden()
+        answer.accept(kwargs['accept'])
+
+        if self.request.is_ajax():
+            return JsonResponse({'accepted': kwargs['accept']})
+        return HttpResponseRedirect(
+            '{}#c{}'.format(answer.get_absolute_url(), answer.pk))
+
+
+class StaticFileView(View):
+    """
+    Serve collected files from STATIC_ROOT when there is no web server in
+    front of the app (settings.SERVE_STATIC). Picks the precompressed .br or
+    .gz copy written by collectstatic if the client accepts it. The file is
+    returned as a FileResponse, which the WSGI server hands to its
+    wsgi.file_wrapper, so e.g. gunicorn streams it with zero-copy sendfile().
+    """
+    # ManifestStaticFilesStorage inserts the first 12 hex digits of the MD5.
+    hashed_name_re = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def get(self, request, path):
+        try:
+            fullpath = safe_join(settings.STATIC_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(fullpath):
+            raise Http404
+
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        accepted = parse_accept_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for name, ext in self.encodings:
+            if encoding is None and accepted.get(name, 0) > 0 \
+                    and os.path.isfile(fullpath + ext):
+                fullpath, encoding = fullpath + ext, name
+                break
+
+        stat = os.stat(fullpath)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                  stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+
+        response = FileResponse(open(fullpath, 'rb'),
+                                content_type=content_type or 'text/plain')
+        response['Content-Length'] = stat.st_size
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+
+        if self.hashed_name_re.search(path):
+            patch_cache_control(response, public=True, immutable=True,
+                                max_age=settings.STATIC_MAX_AGE)
+        else:
+            patch_cache_control(response, public=True,
+                                max_age=settings.STATIC_UNHASHED_MAX_AGE)
+        return response
+
+
+class SitemapView(View):
+    """
+    Serve the sitemap files written by the build_sitemaps command, for
+    deployments where the web server doesn't serve SITEMAP_ROOT itself.
+    """
+
+    def get(self, request, name):
+        fullpath = os.path.join(settings.SITEMAP_ROOT, name)
+        if not os.path.isfile(fullpath):
+            raise Http404
+
+        stat = os.stat(fullpath)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                  stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+
+        response = FileResponse(open(fullpath, 'rb'),
+                                content_type='application/xml')
+        response['Content-Length'] = stat.st_size
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return response
@@ -0,0 +1,137 @@
+"""
+Warm up a worker process before it serves requests: populate the URL
+resolver, compile all templates into the cached template loader and run
+the Markdown and bleach pipeline once, so that its modules are imported
+and its cleaner is built. pgm4/wsgi.py calls warm_up() when the
+application is loaded. With a pre-forking server that loads the
+application before forking (e.g. "gunicorn --preload"), every worker
+starts out warm and the work is done once per deploy.
+
+ImportTimer measures how long importing each module takes, see the
+bench_startup command. This module only imports the standard library at
+the top, so that it can be imported before Django is set up.
+"""
+import builtins
+import os
+import sys
+import time
+from collections import OrderedDict
+
+
+class ImportTimer:
+    """
+    Record the time spent importing every module imported while active,
+    including the modules it imports itself.
+    """
+
+    def __init__(self):
+        self.times = OrderedDict()
+
+    def __enter__(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(),
+                      level=0):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self.times.setdefault(name, time.perf_counter() - start)
+
+    def slowest(self, limit=20):
+        return sorted(self.times.items(), key=lambda item: -item[1])[:limit]
+
+
+def _templates():
+    from django.conf import settings
+    from django.template.utils import get_app_template_dirs
+    dirs = [d for t in settings.TEMPLATES for d in t.get('DIRS', [])]
+    for root in dirs + list(get_app_template_dirs('templates')):
+        for path, _, files in os.walk(root):
+            for name in files:
+                if name.endswith(('.html', '.txt', '.xml')):
+                    yield os.path.relpath(os.path.join(path, name), root)
+
+
+def warm_up():
+    """Run all warm up steps and return the seconds each step took."""
+    from django.core.urlresolvers import get_resolver
+    from django.db import connections
+    from django.template import TemplateDoesNotExist, TemplateSyntaxError
+    from django.template.loader import get_template
+
+    timings = OrderedDict()
+
+    start = time.perf_counter()
+    get_resolver(None).reverse_dict  # noqa, populates the resolver
+    timings['urls'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in _templates():
+        try:
+            get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            pass  # e.g. a template of an app that is not configured
+    timings['templates'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from pgm4app.rendering import render_text
+    render_text('*Warm* up [pgm4](http://example.com/)\n\n    code')
+    timings['markdown'] = time.perf_counter() - start
+
+    # Nothing above should have connected, but never fork a connection.
+    connections.close_all()
+    return timings
+
+
+def _get(application, path, host):
+    import io
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SCRIPT_NAME': '', 'SERVER_NAME': host, 'SERVER_PORT': '80',
+        'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False, 'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    response = application(environ, lambda status, *args: statuses.append(
+        status))
+    b''.join(response)
+    response.close()
+    return statuses[0]
+
+
+def measure_startup(started, paths, trace_imports=False):
+    """
+    Load pgm4.wsgi as a WSGI server would, request every path twice and
+    print the timings as JSON. Run by the bench_startup command in a fresh
+    interpreter; started is the time.perf_counter() at its start.
+    """
+    import json
+    timer = ImportTimer()
+    if trace_imports:
+        with timer:
+            from pgm4.wsgi import application
+    else:
+        from pgm4.wsgi import application
+    from django.conf import settings
+
+    result = {'load': time.perf_counter() - started, 'requests': [],
+              'imports': timer.slowest()}
+    host = settings.ALLOWED_HOSTS[0]
+    for path in paths:
+        for _ in range(2):
+            start = time.perf_counter()
+            status = _get(application, path, host)
+            result['requests'].append(
+                [path, status, time.perf_counter() - start])
+    print(json.dumps(result))